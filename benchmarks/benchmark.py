@@ -0,0 +1,174 @@
+"""
+Benchmark fetching and parsing against the local fake portal
+
+    python benchmarks/benchmark.py --devices 10 --modules 4 --parameters 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from datetime import timedelta
+from typing import Callable, Dict
+
+from fake_portal import FakePortal, FleetConfig
+from wemportal.model.wem_compact import CompactWemDeviceParser, CompactWemParameterParser, CompactWemValueParser
+from wemportal.model.wem_device import WemDeviceParser
+from wemportal.model.wem_parameter import WemParameterParser
+from wemportal.model.wem_statistic import GraphType, WemHeatingStatisticParser
+from wemportal.model.wem_value import WemValueParser
+from wemportal.wem_portal import WemPortal
+from wemportal.wem_portal_async import AsyncWemPortal
+
+
+def peak_memory(func: Callable) -> int:
+    """Peak traced memory of func() in bytes"""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def retained_memory(func: Callable) -> int:
+    """Traced memory still held by the result of func() in bytes"""
+    tracemalloc.start()
+    result = func()  # pylint: disable=unused-variable
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return retained
+
+
+def bench_fetch(portal: FakePortal, name: str, fetch: Callable) -> Dict:
+    """Run a full poll and collect portal side counters, memory is traced in a second run"""
+    portal.reset_counts()
+    start = time.perf_counter()
+    fetch()
+    wall_time = time.perf_counter() - start
+    result = {
+        "name": name,
+        "wall_time_s": round(wall_time, 3),
+        "requests": portal.request_count,
+        "response_kib": round(portal.response_bytes / 1024, 1),
+        "requests_by_endpoint": dict(portal.request_counts),
+    }
+    # tracemalloc slows down execution, so it is not active while timing
+    result["peak_memory_kib"] = round(peak_memory(fetch) / 1024, 1)
+    return result
+
+
+def sync_poll(url: str, concurrency: int):
+    """Login, fetch and logout with WemPortal"""
+    # pylint: disable=unused-argument
+    api = WemPortal("benchmark", "benchmark", base_url=url)
+    api.login()
+    devices = api.fetch_devices()
+    api.logout()
+    return devices
+
+
+def async_poll(url: str, concurrency: int):
+    """Login, fetch and logout with AsyncWemPortal"""
+    async def run():
+        api = AsyncWemPortal("benchmark", "benchmark", max_concurrency=concurrency, base_url=url)
+        await api.login()
+        devices = await api.fetch_devices()
+        await api.logout()
+        return devices
+    return asyncio.run(run())
+
+
+def bench_parser(name: str, func: Callable, items: int, repeat: int) -> Dict:
+    """Time a parser call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat
+    return {"name": name, "items": items, "parse_ms": round(elapsed * 1000, 3),
+            "per_item_us": round(elapsed / max(items, 1) * 1e6, 3)}
+
+
+def bench_parsers(portal: FakePortal, days: int, repeat: int):
+    """Parse synthetic payloads of the fake portal, the statistic covers the whole history"""
+    parameters = portal.parameters()["Parameters"]
+    query = {"Modules": [{"ModuleIndex": 0, "ModuleType": 2,
+                          "Parameters": [{"ParameterID": p["ParameterID"]} for p in parameters]}]}
+    values = portal.values(query)["Modules"][0]["Values"]
+    statistic = portal.statistics({"GraphType": [str(int(GraphType.daily))]})
+    statistic["Data"] = [
+        {"Date": (portal.today - timedelta(days=day)).isoformat(), "Value": day % 97 / 4}
+        for day in range(days - 1, -1, -1)
+    ]
+    # Round trip through json to get fresh objects like a real response
+    statistic = json.loads(json.dumps(statistic))
+
+    return [
+        bench_parser("WemParameterParser", lambda: [WemParameterParser.load(p) for p in parameters],
+                     len(parameters), repeat),
+        bench_parser("WemValueParser", lambda: [WemValueParser.load(v) for v in values], len(values), repeat),
+        bench_parser("WemHeatingStatisticParser",
+                     lambda: WemHeatingStatisticParser.load(statistic, GraphType.daily),
+                     len(statistic["Data"]), repeat),
+    ]
+
+
+def build_fleet(portal: FakePortal, device_parser, parameter_parser, value_parser):
+    """Parse the whole fleet of the fake portal with parameters and values, like a long running poller holds it"""
+    parameters = json.dumps(portal.parameters()["Parameters"])
+    devices = []
+    for device_data in portal.devices()["Devices"]:
+        device = device_parser.load(device_data)
+        for module in device.modules:
+            # Fresh objects per module like separate responses
+            module.parameters = [parameter_parser.load(parameter) for parameter in json.loads(parameters)]
+            query = {"Modules": [{"ModuleIndex": module.index, "ModuleType": int(module.type),
+                                  "Parameters": [{"ParameterID": p.parameter_id} for p in module.parameters]}]}
+            values = json.loads(json.dumps(portal.values(query)))["Modules"][0]["Values"]
+            for parameter, value in zip(module.parameters, values):
+                parameter.value = value_parser.load(value)
+        devices.append(device)
+    return devices
+
+
+def bench_models(portal: FakePortal) -> Dict:
+    """Memory held by the parsed fleet with the default and the compact model classes"""
+    default = retained_memory(lambda: build_fleet(portal, WemDeviceParser, WemParameterParser, WemValueParser))
+    compact = retained_memory(lambda: build_fleet(portal, CompactWemDeviceParser, CompactWemParameterParser,
+                                                  CompactWemValueParser))
+    return {
+        "default_kib": round(default / 1024, 1),
+        "compact_kib": round(compact / 1024, 1),
+        "saved_percent": round((1 - compact / default) * 100, 1) if default else 0.0,
+    }
+
+
+def main():
+    """Run all benchmarks and print a json report"""
+    arguments = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arguments.add_argument("--devices", type=int, default=5)
+    arguments.add_argument("--modules", type=int, default=3)
+    arguments.add_argument("--parameters", type=int, default=30)
+    arguments.add_argument("--days", type=int, default=365)
+    arguments.add_argument("--latency", type=float, default=0.02, help="simulated portal latency in seconds")
+    arguments.add_argument("--concurrency", type=int, default=8)
+    arguments.add_argument("--repeat", type=int, default=100, help="repetitions of parser benchmarks")
+    options = arguments.parse_args()
+
+    config = FleetConfig(devices=options.devices, modules=options.modules, parameters=options.parameters,
+                         statistic_days=options.days, latency=options.latency)
+    with FakePortal(config) as portal:
+        report = {
+            "fleet": vars(options),
+            "fetch": [
+                bench_fetch(portal, "WemPortal.fetch_devices", lambda: sync_poll(portal.url, options.concurrency)),
+                bench_fetch(portal, "AsyncWemPortal.fetch_devices",
+                            lambda: async_poll(portal.url, options.concurrency)),
+            ],
+            "parsers": bench_parsers(portal, options.days, options.repeat),
+            "models": bench_models(portal),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Local stand-in for wemportal serving synthetic fleets, for offline tests and benchmarks
+"""
+import json
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+from wemportal.model.wem_statistic import GraphType
+
+_login_page = (
+    '<html><body><form method="post" action="Login.aspx">'
+    '<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="dDwtMTA4MzE0MjEwNTs7Pg==" />'
+    '<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="C2EE9ABB" />'
+    '<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="dDwtNjQ4NzU5NTQ7Oz4=" />'
+    '<input name="ctl00$content$tbxUserName" type="text" />'
+    '<input name="ctl00$content$tbxPassword" type="password" />'
+    '</form></body></html>'
+)
+
+
+@dataclass
+class FleetConfig:
+    """Size of the synthetic fleet, simulated portal latency and extra latency of a device refresh"""
+    devices: int = 2
+    modules: int = 3
+    parameters: int = 20
+    statistic_days: int = 365
+    latency: float = 0.0
+    refresh_latency: float = 0.0
+
+
+class FakePortal:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Threaded http server implementing the api and webgui endpoints used by this module
+
+    Usage::
+
+        with FakePortal(FleetConfig(devices=10, latency=0.05)) as portal:
+            api = WemPortal("user", "password", base_url=portal.url)
+    """
+
+    def __init__(self, config: Optional[FleetConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config: FleetConfig = config or FleetConfig()
+        self.request_counts: Counter = Counter()
+        self.response_bytes: int = 0
+        self.today: datetime = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.__sessions: Set[str] = set()
+        self.__failures: List[int] = []
+        self.__refreshed: Dict[int, int] = {}
+        self.__written: Dict[Tuple[int, int, int, str], float] = {}
+        self.__started: int = int(time.time())
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self.__server.daemon_threads = True
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base url to pass to the clients"""
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakePortal":
+        """Serve in a background thread"""
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self) -> "FakePortal":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def request_count(self) -> int:
+        """Number of requests since the last reset"""
+        return sum(self.request_counts.values())
+
+    def reset_counts(self):
+        """Reset request and byte counters"""
+        with self.__lock:
+            self.request_counts.clear()
+            self.response_bytes = 0
+
+    def expire_sessions(self):
+        """Reject all existing sessions, clients have to login again"""
+        with self.__lock:
+            self.__sessions.clear()
+
+    def fail(self, count: int = 1, status: int = 503):
+        """Answer the next count requests with an error status, to simulate an outage"""
+        with self.__lock:
+            self.__failures.extend([status] * count)
+
+    def next_failure(self) -> Optional[int]:
+        """Error status to answer the current request with, if a failure is pending"""
+        with self.__lock:
+            return self.__failures.pop(0) if self.__failures else None
+
+    def count(self, path: str, response_bytes: int):
+        """Record a served request"""
+        with self.__lock:
+            self.request_counts[path] += 1
+            self.response_bytes += response_bytes
+
+    def new_session(self, prefix: str) -> str:
+        """Create a valid session id"""
+        with self.__lock:
+            session = f"{prefix}{len(self.__sessions)}{time.monotonic_ns()}"
+            self.__sessions.add(session)
+        return session
+
+    def is_valid_session(self, session: Optional[str]) -> bool:
+        """Check a session id sent by a client"""
+        with self.__lock:
+            return session in self.__sessions
+
+    # Synthetic data
+
+    def devices(self) -> Dict:
+        """Device/Read response"""
+        return {"Devices": [
+            {
+                "ID": 1000 + device,
+                "Name": f"Heat pump {device}",
+                "DeviceType": 2,
+                "ConnectionStatus": 0,
+                "HasErrors": False,
+                "Modules": [
+                    {
+                        "Index": module,
+                        "CustomNumbering": module,
+                        "Name": f"Module {module}",
+                        "Type": 2 if module else 6,
+                        "Dynamisation": True,
+                        "FWUVersion": "2.1.0",
+                    }
+                    for module in range(self.config.modules)
+                ],
+            }
+            for device in range(self.config.devices)
+        ]}
+
+    def parameters(self) -> Dict:
+        """EventType/Read response"""
+        return {"Parameters": [
+            {
+                "ParameterID": f"Parameter{parameter}",
+                "Name": f"Parameter {parameter}",
+                "DataType": 1 if parameter % 4 == 0 else 3,
+                "MinValue": 0.0,
+                "MaxValue": 80.0,
+                "DefaultValue": 20.0,
+                "IsReadable": True,
+                "IsWriteable": parameter % 4 == 0,
+                "EnumValues": [
+                    {"Value": 0, "Name": "Aus"}, {"Value": 1, "Name": "Ein"}
+                ] if parameter % 4 == 0 else None,
+            }
+            for parameter in range(self.config.parameters)
+        ]}
+
+    def refresh(self, query: Dict) -> Dict:
+        """DataAccess/Refresh response, values of the device get a new timestamp"""
+        if self.config.refresh_latency:
+            time.sleep(self.config.refresh_latency)
+        with self.__lock:
+            self.__refreshed[query.get("DeviceID")] = int(time.time())
+        return {"Status": 0}
+
+    def write(self, query: Dict) -> Dict:
+        """DataAccess/Write response, written values are returned by later reads"""
+        with self.__lock:
+            for module in query["Modules"]:
+                for parameter in module["Parameters"]:
+                    key = (query["DeviceID"], module["ModuleIndex"], module["ModuleType"], parameter["ParameterID"])
+                    self.__written[key] = parameter["NumericValue"]
+        return {"Status": 0}
+
+    def values(self, query: Dict) -> Dict:
+        """DataAccess/Read response for a parameter query, timestamped with the last refresh of the device"""
+        device_id = query.get("DeviceID")
+        with self.__lock:
+            timestamp = self.__refreshed.get(device_id, self.__started)
+            written = dict(self.__written)
+
+        def value(module: Dict, parameter: Dict, position: int) -> float:
+            key = (device_id, module["ModuleIndex"], module["ModuleType"], parameter["ParameterID"])
+            return written.get(key, 20.0 + (timestamp + position) % 100 / 10)
+
+        return {"Modules": [
+            {
+                "ModuleIndex": module["ModuleIndex"],
+                "ModuleType": module["ModuleType"],
+                "Values": [
+                    {
+                        "ParameterID": parameter["ParameterID"],
+                        "Unit": "°C",
+                        "Timestamp": timestamp,
+                        "NumericValue": value(module, parameter, position),
+                        "StringValue": str(value(module, parameter, position)),
+                        "Dynamisation": position % 2 == 0,
+                    }
+                    for position, parameter in enumerate(module["Parameters"])
+                ],
+            }
+            for module in query["Modules"]
+        ]}
+
+    def statistics(self, form: Dict[str, List[str]]) -> Dict:
+        """GetStatistics response, one window ending at MaxDisplayTime"""
+        graph_type = GraphType(int(form.get("GraphType", ["0"])[0]))
+        max_display_time = datetime.fromisoformat(form.get("MaxDisplayTime", [self.today.isoformat()])[0])
+        end = min(max_display_time.replace(hour=0, minute=0, second=0, microsecond=0), self.today)
+        first = self.today - timedelta(days=self.config.statistic_days - 1)
+        seed = int(form.get("StatisticsType", ["1"])[0])
+
+        if graph_type == GraphType.daily:
+            dates = [end - timedelta(days=day) for day in range(30, -1, -1)]
+            dates = [date for date in dates if date >= first]
+        elif graph_type == GraphType.monthly:
+            months = end.year * 12 + end.month - 1
+            dates = [datetime((months - month) // 12, (months - month) % 12 + 1, 1) for month in range(11, -1, -1)]
+            dates = [date for date in dates if date >= first.replace(day=1)]
+        else:
+            dates = [datetime(year, 1, 1) for year in range(end.year - 4, end.year + 1) if year >= first.year]
+
+        return {
+            "HasData": bool(dates),
+            "MaxDate": (dates[-1] if dates else end).isoformat(),
+            "MinDate": (dates[0] if dates else end).isoformat(),
+            "Unit": "kWh",
+            "Data": [{"Date": date.isoformat(), "Value": (date.toordinal() * seed) % 97 / 4} for date in dates],
+        }
+
+
+def _handler_for(portal: FakePortal):
+    """Request handler class bound to a portal"""
+
+    class Handler(BaseHTTPRequestHandler):
+        """Dispatch requests of the fake portal"""
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Handle GET"""
+            self._dispatch()
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            """Handle POST"""
+            self._dispatch()
+
+        def _dispatch(self):
+            path = urlparse(self.path).path
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+            if portal.config.latency:
+                time.sleep(portal.config.latency)
+
+            cookies = dict(
+                cookie.strip().split("=", 1)
+                for cookie in (self.headers.get("Cookie") or "").split(";")
+                if "=" in cookie
+            )
+            failure = portal.next_failure()
+            if failure:
+                self._send(path, b"", status=failure)
+            elif path == "/app/Account/Login":
+                self._send(path, b"{}", cookies={"api": portal.new_session("api")})
+            elif path == "/Web/Login.aspx":
+                if self.command == "POST":
+                    self._send(path, _login_page.encode(), "text/html", cookies={"web": portal.new_session("web")})
+                else:
+                    self._send(path, _login_page.encode(), "text/html")
+            elif path.startswith("/app/") and not portal.is_valid_session(cookies.get("api")):
+                self._send(path, b"", status=401)
+            elif path.startswith("/Web/") and not portal.is_valid_session(cookies.get("web")):
+                self._send(path, b"", status=302, headers={"Location": "/Web/Login.aspx"})
+            else:
+                self._send_json(path, self._route(path, body))
+
+        def _route(self, path: str, body: str):
+            routes = {
+                "/app/Device/Read": portal.devices,
+                "/app/EventType/Read": portal.parameters,
+                "/app/DataAccess/Refresh": lambda: portal.refresh(json.loads(body)),
+                "/app/DataAccess/Read": lambda: portal.values(json.loads(body)),
+                "/app/DataAccess/Write": lambda: portal.write(json.loads(body)),
+                "/Web/Api/DeviceStatistics/GetStructure": lambda: [
+                    {"Modules": [{"SystemTableID": 1}, {"SystemTableID": 2}]}
+                ],
+                "/Web/Api/DeviceStatistics/GetStatistics": lambda: portal.statistics(parse_qs(body)),
+            }
+            return routes.get(path, dict)()
+
+        def _send_json(self, path: str, data):
+            self._send(path, json.dumps(data).encode())
+
+        def _send(self, path: str, content: bytes, content_type: str = "application/json",
+                  status: int = 200, cookies: Optional[Dict] = None, headers: Optional[Dict] = None):
+            # pylint: disable=too-many-arguments
+            portal.count(path, len(content))
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
+            for name, value in (cookies or {}).items():
+                self.send_header("Set-Cookie", f"{name}={value}; Path=/")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
@@ -0,0 +1,63 @@
+"""
+Measure import times in fresh interpreters and fail if a budget is exceeded
+
+    python benchmarks/import_time.py --repeat 10 --scale 2
+
+Each module also has dependencies it must not import, these checks do not depend on machine speed.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Module, budget of the cumulative import time in milliseconds and modules it must not import
+budgets: List[Tuple[str, float, Tuple[str, ...]]] = [
+    ("wemportal", 5, ("requests", "bs4", "dateutil", "wemportal.model")),
+    ("wemportal.__main__", 10, ("requests", "bs4", "dateutil")),
+    ("wemportal.model.wem_device", 60, ("requests", "bs4", "dateutil")),
+    ("wemportal.export", 70, ("requests", "bs4", "dateutil")),
+    ("wemportal.wem_portal", 300, ("bs4", "dateutil", "wemportal.model.wem_compact")),
+]
+
+
+def measure(module: str) -> Tuple[float, List[str]]:
+    """Cumulative import time of module in milliseconds and the modules loaded in a fresh interpreter"""
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True)
+    # The module's own line is the last with its name, its cumulative time is the second column in us
+    for line in reversed(result.stderr.splitlines()):
+        columns = line.split("|")
+        if len(columns) == 3 and columns[2].strip() == module:
+            return int(columns[1]) / 1000, result.stdout.split()
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def main():
+    """Measure all budgets, print a json report and exit with 1 on a regression"""
+    arguments = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arguments.add_argument("--repeat", type=int, default=5, help="runs per module, the median is reported")
+    arguments.add_argument("--scale", type=float, default=1.0, help="multiply budgets, for slow machines")
+    options = arguments.parse_args()
+
+    report: List[Dict] = []
+    for module, budget, forbidden in budgets:
+        runs = [measure(module) for _ in range(options.repeat)]
+        import_ms = statistics.median(run[0] for run in runs)
+        loaded = [name for name in forbidden if any(m == name or m.startswith(f"{name}.") for m in runs[0][1])]
+        report.append({
+            "module": module,
+            "import_ms": round(import_ms, 2),
+            "budget_ms": budget * options.scale,
+            "forbidden_imports": loaded,
+            "ok": import_ms <= budget * options.scale and not loaded,
+        })
+
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(entry["ok"] for entry in report) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,41 @@
 """
 Module to scrape wemportal
+
+Clients are imported on first access, so importing the models does not load requests.
 """
-from wemportal.wem_portal_api import WemPortalAPI
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from wemportal.fleet import FleetManager
+    from wemportal.gateway import Gateway
+    from wemportal.wem_portal import WemPortal
+    from wemportal.wem_portal_api import WemPortalAPI
+    from wemportal.wem_portal_async import AsyncWemPortal
+    from wemportal.wem_portal_web import WemPortalWeb
+
+# Public name and the module defining it
+_lazy_attributes = {
+    "WemPortalAPI": "wemportal.wem_portal_api",
+    "WemPortalWeb": "wemportal.wem_portal_web",
+    "WemPortal": "wemportal.wem_portal",
+    "AsyncWemPortal": "wemportal.wem_portal_async",
+    "FleetManager": "wemportal.fleet",
+    "Gateway": "wemportal.gateway",
+}
+
+__all__ = list(_lazy_attributes)
+
+
+def __getattr__(name: str):
+    module = _lazy_attributes.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    # Cache in the module namespace, later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
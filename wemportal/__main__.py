@@ -0,0 +1,165 @@
+"""
+Command line collector, fetches values or statistics and prints or exports them
+
+    python -m wemportal values --format csv --cache-dir ~/.cache/wemportal
+    WEMPORTAL_PASSWORD=... python -m wemportal statistics --username me --format influx
+    python -m wemportal serve --port 8080 --interval 60
+
+Clients and exporters are imported after the arguments are parsed, so --help and errors return fast.
+"""
+import argparse
+import os
+import sys
+from typing import List, Optional
+from wemportal.exceptions import WemPortalError
+
+_formats = ("table", "csv", "jsonl", "influx")
+
+
+def _arguments() -> argparse.ArgumentParser:
+    arguments = argparse.ArgumentParser(prog="python -m wemportal", description=__doc__,
+                                        formatter_class=argparse.RawDescriptionHelpFormatter)
+    arguments.add_argument("data", nargs="?", choices=("values", "statistics", "serve"), default="values",
+                           help="fetch parameter values or statistics, or serve them over http, default: values")
+    arguments.add_argument("--username", default=os.environ.get("WEMPORTAL_USERNAME"),
+                           help="defaults to $WEMPORTAL_USERNAME")
+    arguments.add_argument("--password", default=os.environ.get("WEMPORTAL_PASSWORD"),
+                           help="defaults to $WEMPORTAL_PASSWORD")
+    arguments.add_argument("--format", choices=_formats, default="table")
+    arguments.add_argument("--output", help="file to write to, default: stdout")
+    arguments.add_argument("--cache-dir", default=os.environ.get("WEMPORTAL_CACHE_DIR"),
+                           help="keep sessions, parameter definitions and device structure between runs, "
+                                "defaults to $WEMPORTAL_CACHE_DIR")
+    arguments.add_argument("--base-url", help="portal url, for testing against a local portal")
+    arguments.add_argument("--verbose", "-v", action="store_true", help="log requests")
+    serve = arguments.add_argument_group("serve")
+    serve.add_argument("--host", default="127.0.0.1", help="address to serve on, default: 127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080, help="port to serve on, default: 8080")
+    serve.add_argument("--interval", type=float, default=60, help="seconds between portal polls, default: 60")
+    serve.add_argument("--statistics", action="store_true", help="also poll statistics")
+    return arguments
+
+
+def _print_table(file, devices, data: str) -> int:
+    if data == "values":
+        from wemportal.export import parameter_rows  # pylint: disable=import-outside-toplevel
+        rows = [(row[1], row[4], row[6], row[12] if row[12] is not None else row[11], row[14] or "")
+                for row in parameter_rows(devices)]
+        header = ("Device", "Module", "Parameter", "Value", "Unit")
+    else:
+        from wemportal.export import statistic_rows  # pylint: disable=import-outside-toplevel
+        rows = [(row[1], row[2], row[5].date().isoformat(), f"{row[6]:.2f}", row[4] or "")
+                for row in statistic_rows(devices)]
+        header = ("Device", "Statistic", "Date", "Value", "Unit")
+
+    widths = [max([len(str(column))] + [len(str(row[index])) for row in rows]) for index, column in enumerate(header)]
+    for row in [header] + rows:
+        file.write("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip() + "\n")
+    return len(rows)
+
+
+def _write(file, devices, data: str, output_format: str) -> int:
+    # pylint: disable=import-outside-toplevel
+    if output_format == "table":
+        return _print_table(file, devices, data)
+
+    from wemportal import export
+    if output_format == "influx":
+        if data == "values":
+            return export.write_parameters_influx(file, devices)
+        return export.write_statistics_influx(file, devices)
+
+    columns, rows = ((export.parameter_columns, export.parameter_rows(devices)) if data == "values"
+                     else (export.statistic_columns, export.statistic_rows(devices)))
+    if output_format == "csv":
+        return export.write_csv(file, columns, rows)
+    return export.write_jsonl(file, columns, rows)
+
+
+def _fetch(options: argparse.Namespace):
+    # pylint: disable=import-outside-toplevel
+    from wemportal.cache import ParameterCache, StructureCache
+    from wemportal.session_store import FileSessionStore
+    from wemportal.wem_portal import WemPortal
+
+    def cache_file(name: str) -> Optional[str]:
+        return os.path.join(options.cache_dir, name) if options.cache_dir else None
+
+    if options.cache_dir:
+        os.makedirs(options.cache_dir, exist_ok=True)
+    portal = WemPortal(
+        username=options.username,
+        password=options.password,
+        structure_cache=StructureCache(path=cache_file("structure.json")),
+        parameter_cache=ParameterCache(path=cache_file("parameters.json")),
+        session_store=FileSessionStore(cache_file("sessions.json")) if options.cache_dir else None,
+        base_url=options.base_url,
+    )
+    portal.login()
+    try:
+        return portal.fetch_devices(statistics_types=None if options.data == "statistics" else ())
+    finally:
+        portal.logout()
+
+
+def _serve(options: argparse.Namespace):
+    # pylint: disable=import-outside-toplevel
+    from wemportal.cache import ParameterCache, StructureCache
+    from wemportal.fleet import FleetManager
+    from wemportal.gateway import Gateway
+    from wemportal.session_store import FileSessionStore
+
+    def cache_file(name: str) -> Optional[str]:
+        return os.path.join(options.cache_dir, name) if options.cache_dir else None
+
+    if options.cache_dir:
+        os.makedirs(options.cache_dir, exist_ok=True)
+    fleet = FleetManager(
+        [(options.username, options.password)],
+        statistics=options.statistics,
+        structure_cache=StructureCache(path=cache_file("structure.json")),
+        parameter_cache=ParameterCache(path=cache_file("parameters.json")),
+        session_store=FileSessionStore(cache_file("sessions.json")) if options.cache_dir else None,
+        base_url=options.base_url,
+    )
+    gateway = Gateway(fleet, interval=options.interval, host=options.host, port=options.port)
+    print(f"wemportal: serving on {gateway.url}", file=sys.stderr)
+    gateway.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the collector, returns the exit code"""
+    options = _arguments().parse_args(argv)
+    if not options.username or not options.password:
+        print("wemportal: username and password are required, see --help", file=sys.stderr)
+        return 2
+
+    if options.verbose:
+        import logging  # pylint: disable=import-outside-toplevel
+        logging.basicConfig(level=logging.DEBUG, format="%(asctime)s %(name)s %(message)s")
+
+    if options.data == "serve":
+        try:
+            _serve(options)
+        except OSError as error:
+            print(f"wemportal: {error}", file=sys.stderr)
+            return 1
+        return 0
+
+    try:
+        devices = _fetch(options)
+    except (WemPortalError, OSError) as error:
+        # Portal, network and requests errors
+        print(f"wemportal: {error}", file=sys.stderr)
+        return 1
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8", newline="") as file:
+            _write(file, devices, options.data, options.format)
+    else:
+        _write(sys.stdout, devices, options.data, options.format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
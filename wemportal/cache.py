@@ -0,0 +1,125 @@
+"""
+Caches to avoid repeated portal requests
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from wemportal.constants import LOGGER
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_module import WemModule
+
+
+def _load_json(path: Optional[str]) -> Dict:
+    """Load a json cache file, an unreadable file is treated as empty cache"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        LOGGER.warning("Ignoring unreadable cache file %s: %s", path, error)
+        return {}
+
+
+def _dump_json(path: Optional[str], data: Dict, private: bool = False):
+    """Atomically write a json cache file, private files are only accessible by the owner"""
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    file_descriptor = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 if private else 0o666)
+    with open(file_descriptor, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+class _JsonCache:
+    """
+    Thread safe dict of cache entries, optionally persisted as json file
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path: Optional[str] = path
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict] = _load_json(path)
+        self._dirty: bool = False
+
+    def save(self):
+        """Write pending changes to disk"""
+        with self._lock:
+            if self._dirty:
+                _dump_json(self.path, self._entries)
+                self._dirty = False
+
+    def invalidate(self, device_id: Optional[int] = None):
+        """Drop the entries of a device or the whole cache"""
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+            else:
+                prefix = f"{device_id}/"
+                for key in [key for key in self._entries if key == str(device_id) or key.startswith(prefix)]:
+                    del self._entries[key]
+            self._dirty = True
+            self.save()
+
+
+class StructureCache(_JsonCache):
+    """
+    Cache of the statistic structure (SystemTableIDs) per device
+    """
+
+    def __init__(self, ttl: float = 24 * 60 * 60, path: Optional[str] = None):
+        super().__init__(path)
+        self.ttl: float = ttl
+
+    def get(self, device_id: int) -> Optional[List[int]]:
+        """Return cached SystemTableIDs or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(str(device_id))
+        if entry is None or time.time() - entry["timestamp"] > self.ttl:
+            return None
+        return entry["system_table_ids"]
+
+    def set(self, device_id: int, system_table_ids: List[int]):
+        """Store SystemTableIDs of a device"""
+        with self._lock:
+            self._entries[str(device_id)] = {
+                "timestamp": time.time(),
+                "system_table_ids": system_table_ids,
+            }
+            self._dirty = True
+            self.save()
+
+
+class ParameterCache(_JsonCache):
+    """
+    Cache of raw parameter definitions per device module and firmware version
+    """
+
+    @staticmethod
+    def _key(device_id: int, module: WemModule) -> str:
+        return f"{device_id}/{module.index}/{int(module.type)}/{module.fwu_version}"
+
+    def get(self, device_id: int, module: WemModule) -> Optional[List[Dict]]:
+        """Return cached raw parameters of a module or None"""
+        with self._lock:
+            entry = self._entries.get(self._key(device_id, module))
+        return None if entry is None else entry["parameters"]
+
+    def set(self, device_id: int, module: WemModule, parameters: List[Dict]):
+        """Store raw parameters of a module, call save() to persist them"""
+        with self._lock:
+            self._entries[self._key(device_id, module)] = {"parameters": parameters}
+            self._dirty = True
+
+    def prune(self, device: WemDevice):
+        """Drop entries of modules or firmware versions the device does not report anymore"""
+        current = {self._key(device.id, module) for module in device.modules}
+        prefix = f"{device.id}/"
+        with self._lock:
+            stale = [key for key in self._entries if key.startswith(prefix) and key not in current]
+            for key in stale:
+                del self._entries[key]
+            self._dirty = self._dirty or bool(stale)
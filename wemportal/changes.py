@@ -0,0 +1,138 @@
+"""
+Detect changed parameter values between polls and pass only the changes to subscribers
+"""
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from wemportal.constants import LOGGER
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_module import WemModule
+from wemportal.model.wem_parameter import DataType, WemParameter
+from wemportal.model.wem_value import WemValue
+
+# Device id, module index, module type and parameter id
+_Key = Tuple[int, int, int, str]
+
+
+@dataclass
+class ValueChange:
+    """New value of a parameter, previous is None for the first value"""
+    device: WemDevice
+    module: WemModule
+    parameter: WemParameter
+    previous: Optional[WemValue]
+    value: WemValue
+
+
+class Subscription:
+    # pylint: disable=too-few-public-methods
+    """
+    Callback receiving the changes of a device poll as one list
+
+    Numeric values are only passed on once they moved at least deadband away from the value last passed on,
+    deadbands overrides it by parameter id. selector and data_types filter on the parameter metadata.
+    """
+
+    def __init__(self, callback: Callable[[List[ValueChange]], None],
+                 deadband: float = 0.0,
+                 deadbands: Optional[Dict[str, float]] = None,
+                 selector: Optional[Callable[[WemModule, WemParameter], bool]] = None,
+                 data_types: Optional[Iterable[DataType]] = None):
+        # pylint: disable=too-many-arguments
+        self.callback: Callable[[List[ValueChange]], None] = callback
+        self.deadband: float = deadband
+        self.deadbands: Dict[str, float] = deadbands or {}
+        self.selector: Optional[Callable[[WemModule, WemParameter], bool]] = selector
+        self.data_types: Optional[frozenset] = frozenset(data_types) if data_types is not None else None
+        self.__passed: Dict[_Key, WemValue] = {}
+
+    def accepts(self, key: _Key, change: ValueChange) -> bool:
+        """Check if the change passes the filters and the deadband, remembers the values passed on"""
+        if self.data_types is not None and change.parameter.data_type not in self.data_types:
+            return False
+        if self.selector is not None and not self.selector(change.module, change.parameter):
+            return False
+        deadband = self.deadbands.get(change.parameter.parameter_id, self.deadband)
+        if deadband:
+            passed = self.__passed.get(key)
+            if passed is not None and _within(passed, change.value, deadband):
+                return False
+            self.__passed[key] = change.value
+        return True
+
+
+def _within(previous: WemValue, value: WemValue, deadband: float) -> bool:
+    # The string value of numeric values is just their text, so only non numeric values compare it
+    if previous.numeric_value is None or value.numeric_value is None:
+        return previous.numeric_value == value.numeric_value and previous.string_value == value.string_value
+    return abs(value.numeric_value - previous.numeric_value) < deadband
+
+
+class ChangeDetector:
+    """
+    Keep the last value of every parameter and pass changed values to subscribers.
+    A value changed if its numeric or string value differs, a new timestamp alone is no change.
+
+    Usage::
+
+        detector = ChangeDetector()
+        detector.subscribe(print, deadband=0.5, data_types=[DataType.value, DataType.decimal_value])
+        api = WemPortal("user", "password", change_detector=detector)
+    """
+
+    def __init__(self):
+        self.subscriptions: List[Subscription] = []
+        self.__values: Dict[_Key, WemValue] = {}
+        self.__lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[List[ValueChange]], None], **filters) -> Subscription:
+        """Add a subscription, see Subscription for deadband and filters"""
+        subscription = Subscription(callback, **filters)
+        with self.__lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Remove a subscription"""
+        with self.__lock:
+            self.subscriptions.remove(subscription)
+
+    def update(self, device: WemDevice, parameters: Iterable[Tuple[WemModule, WemParameter]]) -> List[ValueChange]:
+        """Compare the current values of parameters of a device with their last values, returns the changes"""
+        changes: List[Tuple[_Key, ValueChange]] = []
+        with self.__lock:
+            for module, parameter in parameters:
+                value = parameter.value
+                if value is None:
+                    continue
+                key = (device.id, module.index, int(module.type), parameter.parameter_id)
+                previous = self.__values.get(key)
+                self.__values[key] = value
+                if (previous is not None and previous.numeric_value == value.numeric_value
+                        and previous.string_value == value.string_value):
+                    continue
+                changes.append((key, ValueChange(device, module, parameter, previous, value)))
+
+            deliveries = [
+                (subscription, [change for key, change in changes if subscription.accepts(key, change)])
+                for subscription in self.subscriptions
+            ] if changes else []
+
+        # Callbacks run outside the lock, they may subscribe or unsubscribe.
+        # A failing subscriber neither stops the others nor the poll
+        for subscription, accepted in deliveries:
+            if accepted:
+                try:
+                    subscription.callback(accepted)
+                except Exception:  # pylint: disable=broad-except
+                    LOGGER.exception("Change subscriber %r failed", subscription.callback)
+        return [change for _, change in changes]
+
+    def forget(self, device_id: Optional[int] = None):
+        """Drop the last values of a device or of all devices, their next values count as changes"""
+        with self.__lock:
+            if device_id is None:
+                self.__values.clear()
+            else:
+                for key in [key for key in self.__values if key[0] == device_id]:
+                    del self.__values[key]
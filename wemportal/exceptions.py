@@ -7,7 +7,19 @@ class WemPortalError(Exception):
     """
 
 
+class ParameterValueError(WemPortalError, ValueError):
+    """
+    Raised before writing a value a parameter does not accept
+    """
+
+
 class WemPortalConnectionError(ConnectionError):
     """
     Custom exception for WEM Portal connection errors
     """
+
+
+class CircuitOpenError(WemPortalConnectionError):
+    """
+    Raised without sending a request while the portal keeps failing
+    """
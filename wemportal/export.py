@@ -0,0 +1,133 @@
+"""
+Stream parameter values and statistics to CSV, JSON Lines or InfluxDB line protocol
+"""
+import csv
+import json
+import math
+from datetime import datetime
+from typing import Iterable, Iterator, Sequence, TextIO, Tuple
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_series import from_timestamp
+
+# Same keys as WemDevice.get_parameter_values()
+parameter_columns = (
+    "DeviceId", "DeviceName", "DeviceType", "ModuleIndex", "ModuleName", "ModuleType",
+    "ParameterName", "ParameterId", "ParameterDataType", "ParameterMaxValue", "ParameterMinValue",
+    "ValueStringValue", "ValueNumericValue", "ValueTime", "ValueUnit",
+)
+
+statistic_columns = (
+    "DeviceId", "DeviceName", "StatisticType", "GraphType", "Unit", "Date", "Value",
+)
+
+
+def parameter_rows(devices: Iterable[WemDevice]) -> Iterator[Tuple]:
+    """Lazily yield a tuple per parameter with value, ordered like parameter_columns"""
+    for device in devices:
+        for module in device.modules:
+            prefix = (device.id, device.name, int(device.device_type), module.index, module.name, int(module.type))
+            for parameter in module.parameters:
+                value = parameter.value
+                if value:
+                    yield prefix + (
+                        parameter.name, parameter.parameter_id, int(parameter.data_type),
+                        parameter.max_value, parameter.min_value,
+                        value.string_value, value.numeric_value, value.time, value.unit,
+                    )
+
+
+def statistic_rows(devices: Iterable[WemDevice]) -> Iterator[Tuple]:
+    """Lazily yield a tuple per statistic value, ordered like statistic_columns"""
+    for device in devices:
+        for statistic in device.statistics:
+            prefix = (device.id, device.name, statistic.statistics_type.name, statistic.graph_type.name, statistic.unit)
+            series = statistic.series
+            for timestamp, value in zip(series.timestamps, series.values):
+                yield prefix + (from_timestamp(timestamp, series.tzinfo), value)
+
+
+def write_csv(file: TextIO, columns: Sequence[str], rows: Iterable[Tuple], header: bool = True) -> int:
+    """Write rows as CSV, returns the number of rows"""
+    writer = csv.writer(file)
+    if header:
+        writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def write_jsonl(file: TextIO, columns: Sequence[str], rows: Iterable[Tuple]) -> int:
+    """Write one JSON object per row and line, returns the number of rows"""
+    keys = [f"{json.dumps(column)}:" for column in columns]
+    encode = json.JSONEncoder(default=_json_default, ensure_ascii=False).encode
+    count = 0
+    for row in rows:
+        file.write("{" + ",".join(key + encode(value) for key, value in zip(keys, row)) + "}\n")
+        count += 1
+    return count
+
+
+def _escape_tag(value) -> str:
+    return str(value).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def _escape_field_string(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def write_parameters_influx(file: TextIO, devices: Iterable[WemDevice], measurement: str = "wemportal") -> int:
+    """Write parameter values as InfluxDB line protocol with nanosecond timestamps"""
+    count = 0
+    for device in devices:
+        for module in device.modules:
+            # Tags of device and module are escaped once per module
+            prefix = (
+                f"{_escape_tag(measurement)},device_id={_escape_tag(device.id)},"
+                f"device_name={_escape_tag(device.name)},module_index={module.index},"
+                f"module_name={_escape_tag(module.name)},module_type={int(module.type)}"
+            )
+            for parameter in module.parameters:
+                value = parameter.value
+                if not value:
+                    continue
+                fields = []
+                if value.numeric_value is not None:
+                    fields.append(f"numeric_value={float(value.numeric_value)}")
+                if value.string_value is not None:
+                    fields.append(f"string_value={_escape_field_string(str(value.string_value))}")
+                if not fields:
+                    continue
+                unit = f",unit={_escape_tag(value.unit)}" if value.unit else ""
+                file.write(
+                    f"{prefix},parameter_id={_escape_tag(parameter.parameter_id)}{unit} "
+                    f"{','.join(fields)} {int(value.time.timestamp()) * 1_000_000_000}\n"
+                )
+                count += 1
+    return count
+
+
+def write_statistics_influx(file: TextIO, devices: Iterable[WemDevice],
+                            measurement: str = "wemportal_statistic") -> int:
+    """Write statistic series as InfluxDB line protocol, timestamps are the naive portal dates"""
+    count = 0
+    for device in devices:
+        for statistic in device.statistics:
+            prefix = (
+                f"{_escape_tag(measurement)},device_id={_escape_tag(device.id)},"
+                f"device_name={_escape_tag(device.name)},statistic_type={statistic.statistics_type.name},"
+                f"graph_type={statistic.graph_type.name},unit={_escape_tag(statistic.unit)} value="
+            )
+            series = statistic.series
+            for timestamp, value in zip(series.timestamps, series.values):
+                if not math.isnan(value):
+                    file.write(f"{prefix}{value} {int(timestamp) * 1_000_000_000}\n")
+                    count += 1
+    return count
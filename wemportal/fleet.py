@@ -0,0 +1,171 @@
+"""
+Poll many wemportal accounts with shared connections and rate limits
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from wemportal.cache import ParameterCache, StructureCache
+from wemportal.changes import ChangeDetector
+from wemportal.constants import LOGGER
+from wemportal.metrics import Instrumentation
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_statistic import StatisticType
+from wemportal.refresh import RefreshPolicy
+from wemportal.resilience import AdaptiveLimit, ResiliencePolicy
+from wemportal.session_store import SessionStore
+# RateLimiter and SharedPoolAdapter moved to wemportal.transport, they stay importable from here
+from wemportal.transport import RateLimiter, SharedPoolAdapter, Transport  # pylint: disable=unused-import
+from wemportal.wem_portal_api import WemPortalAPI
+from wemportal.wem_portal_web import WemPortalWeb
+
+
+@dataclass
+class Account:
+    """Credentials of an account and its optional request rate limit per second"""
+    username: str
+    password: str
+    rate_limit: Optional[float] = None
+
+
+@dataclass
+class FleetResult:
+    """Devices of an account or the error that stopped its poll"""
+    username: str
+    devices: List[WemDevice] = field(default_factory=list)
+    error: Optional[BaseException] = None
+    duration: float = 0.0
+
+
+class _AccountClient:
+    # pylint: disable=too-few-public-methods
+    """Api and web client of a single account, polled by one thread at a time"""
+
+    def __init__(self, api: WemPortalAPI, web: WemPortalWeb):
+        self.api: WemPortalAPI = api
+        self.web: WemPortalWeb = web
+        self.lock = threading.Lock()
+        self.web_logged_in: bool = False
+
+
+class FleetManager:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Poll many accounts concurrently
+
+    All sessions share one connection pool. Requests are limited globally and per account,
+    results are yielded as soon as an account is done.
+    """
+
+    def __init__(self, accounts: Iterable[Union[Account, Tuple[str, str]]],
+                 max_workers: int = 8,
+                 rate_limit: Optional[float] = None,
+                 account_rate_limit: Optional[float] = None,
+                 statistics: bool = True,
+                 structure_cache: Optional[StructureCache] = None,
+                 parameter_cache: Optional[ParameterCache] = None,
+                 session_store: Optional[SessionStore] = None,
+                 base_url: Optional[str] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 compact_models: bool = False,
+                 refresh_policy: Optional[RefreshPolicy] = None,
+                 change_detector: Optional[ChangeDetector] = None):
+        # pylint: disable=too-many-arguments
+        self.accounts: List[Account] = [
+            account if isinstance(account, Account) else Account(*account) for account in accounts
+        ]
+        self.statistics: bool = statistics
+        self.session_store: Optional[SessionStore] = session_store
+        self.base_url: Optional[str] = base_url
+        self.account_rate_limit: Optional[float] = account_rate_limit
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
+        self.compact_models: bool = compact_models
+        self.refresh_policy: Optional[RefreshPolicy] = refresh_policy
+        self.change_detector: Optional[ChangeDetector] = change_detector
+        # Caches are shared by all accounts
+        self.parameter_cache: ParameterCache = parameter_cache or ParameterCache()
+        self.structure_cache: StructureCache = structure_cache or StructureCache()
+        self.__global_limiter: Optional[RateLimiter] = (
+            RateLimiter(rate_limit, burst=max_workers) if rate_limit else None
+        )
+        self.__transport: Transport = Transport(pool_size=max_workers)
+        # Concurrency adapts to the health of the portal across all accounts
+        self.__limit: AdaptiveLimit = AdaptiveLimit(max_workers)
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max_workers,
+                                                                 thread_name_prefix="wemportal-fleet")
+        self.__clients: Dict[str, _AccountClient] = {}
+
+    def __client(self, account: Account) -> _AccountClient:
+        client = self.__clients.get(account.username)
+        if client is None:
+            limiters = [self.__global_limiter] if self.__global_limiter else []
+            account_rate_limit = account.rate_limit or self.account_rate_limit
+            if account_rate_limit:
+                limiters.append(RateLimiter(account_rate_limit))
+            # Circuit breakers are per account, a failing account does not stop the others
+            resilience = ResiliencePolicy(limit=self.__limit)
+            client = _AccountClient(
+                api=WemPortalAPI(account.username, account.password, parameter_cache=self.parameter_cache,
+                                 session_store=self.session_store, base_url=self.base_url,
+                                 session=self.__transport.session(limiters), resilience=resilience,
+                                 instrumentation=self.instrumentation, compact_models=self.compact_models,
+                                 refresh_policy=self.refresh_policy, change_detector=self.change_detector),
+                web=WemPortalWeb(account.username, account.password, structure_cache=self.structure_cache,
+                                 session_store=self.session_store, base_url=self.base_url,
+                                 session=self.__transport.session(limiters), resilience=resilience,
+                                 instrumentation=self.instrumentation),
+            )
+            self.__clients[account.username] = client
+        return client
+
+    def __poll_account(self, account: Account, client: _AccountClient) -> FleetResult:
+        start = time.monotonic()
+        try:
+            devices = client.api.fetch()
+            if self.statistics:
+                if not client.web_logged_in:
+                    client.web.login()
+                    client.web_logged_in = True
+                for device in devices:
+                    for statistics_type in StatisticType:
+                        client.web.get_statistic(device, statistics_type)
+            return FleetResult(account.username, devices=devices, duration=time.monotonic() - start)
+        except Exception as error:  # pylint: disable=broad-except
+            LOGGER.warning("Polling account %s failed: %s", account.username, error)
+            return FleetResult(account.username, error=error, duration=time.monotonic() - start)
+        finally:
+            client.lock.release()
+
+    def poll(self, timeout: Optional[float] = None) -> Iterator[FleetResult]:
+        """
+        Poll all accounts and yield their results in order of completion.
+        Accounts still running after timeout seconds, or still busy with the previous poll, yield an error.
+        """
+        futures = {}
+        for account in self.accounts:
+            client = self.__client(account)
+            if not client.lock.acquire(blocking=False):
+                yield FleetResult(account.username, error=TimeoutError("Previous poll still running"))
+                continue
+            futures[self.__executor.submit(self.__poll_account, account, client)] = account
+
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                pending.discard(future)
+                yield future.result()
+        except FutureTimeoutError:
+            for future in pending:
+                if future.done():
+                    yield future.result()
+                else:
+                    yield FleetResult(futures[future].username, error=TimeoutError(f"Poll exceeded {timeout}s"))
+
+    def close(self):
+        """Stop workers and close all connections"""
+        self.__executor.shutdown(wait=False)
+        for client in self.__clients.values():
+            if client.api.session is not None:
+                client.api.logout()
+        self.__transport.close()
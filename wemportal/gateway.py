@@ -0,0 +1,322 @@
+"""
+Local caching gateway, polls the portal on a schedule and serves the latest data to any number of consumers
+
+    GET /devices      device tree with parameter values of all accounts
+    GET /values       one object per parameter value, keys like export.parameter_columns
+    GET /statistics   one object per statistic value, keys like export.statistic_columns
+    GET /events       server-sent events, an update event per changed snapshot
+    GET /health       last poll time and error per account, never answered with 304
+
+Responses carry an ETag and Last-Modified and answer conditional requests with 304.
+A request with If-None-Match and ?wait=<seconds> long-polls until the data changes.
+Until the first poll is done every resource answers 503.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from wemportal import export
+from wemportal.constants import LOGGER
+from wemportal.fleet import FleetManager
+from wemportal.model.wem_device import WemDevice
+
+# Longest long-poll wait a consumer may ask for, in seconds
+max_wait = 300.0
+
+
+@dataclass
+class AccountState:
+    """Latest devices of an account and the outcome of its last poll"""
+    devices: List[WemDevice]
+    updated: Optional[float] = None
+    error: Optional[str] = None
+
+
+def _device_json(device: WemDevice) -> Dict:
+    return {
+        "id": device.id,
+        "name": device.name,
+        "device_type": device.device_type.name,
+        "connection_status": device.connection_status.name,
+        "has_errors": device.has_errors,
+        "modules": [{
+            "index": module.index,
+            "type": module.type.name,
+            "name": module.name,
+            "parameters": [{
+                "id": parameter.parameter_id,
+                "name": parameter.name,
+                "data_type": parameter.data_type.name,
+                "writeable": parameter.is_writeable,
+                "numeric_value": parameter.value.numeric_value if parameter.value else None,
+                "string_value": parameter.value.string_value if parameter.value else None,
+                "unit": parameter.value.unit if parameter.value else None,
+                "time": parameter.value.time.isoformat() if parameter.value else None,
+            } for parameter in module.parameters],
+        } for module in device.modules],
+    }
+
+
+def _rows_json(columns, rows) -> List[Dict]:
+    return [
+        {column: value.isoformat() if hasattr(value, "isoformat") else value for column, value in zip(columns, row)}
+        for row in rows
+    ]
+
+
+class Gateway:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Own the upstream sessions of a fleet, poll it every interval seconds and serve the results over http.
+    Responses are rendered once per poll and shared between consumers.
+
+    Usage::
+
+        fleet = FleetManager([("user", "password")], statistics=False)
+        with Gateway(fleet, interval=60, port=8080) as gateway:
+            ...  # consumers GET gateway.url + "/values"
+    """
+
+    def __init__(self, fleet: FleetManager, interval: float = 60, host: str = "127.0.0.1", port: int = 8080,
+                 poll_timeout: Optional[float] = None):
+        # pylint: disable=too-many-arguments
+        self.fleet: FleetManager = fleet
+        self.interval: float = interval
+        self.poll_timeout: Optional[float] = poll_timeout
+        self.accounts: Dict[str, AccountState] = {}
+        self.version: int = 0
+        self.modified: float = time.time()
+        self.__digest: Optional[str] = None
+        self.__etag: Optional[str] = None
+        self.__bodies: Dict[str, bytes] = {}
+        self.__changed = threading.Condition()
+        self.__stopped = threading.Event()
+        self.__server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self.__server.daemon_threads = True
+        self.__threads: List[threading.Thread] = []
+        self.__renderers: Dict[str, Callable[[], object]] = {
+            "/devices": self.__render_devices,
+            "/values": lambda: _rows_json(export.parameter_columns, export.parameter_rows(self.__devices())),
+            "/statistics": lambda: _rows_json(export.statistic_columns, export.statistic_rows(self.__devices())),
+            "/health": self.__render_health,
+        }
+
+    @property
+    def url(self) -> str:
+        """Base url of the local api"""
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def etag(self) -> Optional[str]:
+        """ETag of the current snapshot, None before the first poll"""
+        return self.__etag
+
+    @property
+    def paths(self) -> List[str]:
+        """Paths of the served resources besides /events"""
+        return list(self.__renderers)
+
+    def poll(self) -> bool:
+        """Poll all accounts once, returns whether the served data changed"""
+        for result in self.fleet.poll(timeout=self.poll_timeout):
+            state = self.accounts.setdefault(result.username, AccountState(devices=[]))
+            if result.error is None:
+                # Failed polls keep serving the last known devices
+                state.devices = result.devices
+                state.updated = time.time()
+                state.error = None
+            else:
+                state.error = f"{type(result.error).__name__}: {result.error}"
+
+        # Devices change in place during the next poll, so consumers only ever see the rendered bodies
+        bodies = {path: json.dumps(render()).encode() for path, render in self.__renderers.items()}
+        # Poll times in /health change every poll, only data changes make a new snapshot
+        digest = hashlib.sha1(b"".join(body for path, body in bodies.items() if path != "/health")).hexdigest()
+        with self.__changed:
+            self.__bodies = bodies
+            if digest == self.__digest:
+                return False
+            self.__digest = digest
+            # Derived from the content, so tags held by consumers stay valid across restarts only for equal data
+            self.__etag = f'"{digest[:20]}"'
+            self.version += 1
+            self.modified = time.time()
+            self.__changed.notify_all()
+        return True
+
+    def wait(self, version: int, timeout: float) -> int:
+        """Wait until the snapshot is newer than version or timeout elapsed, returns the current version"""
+        with self.__changed:
+            self.__changed.wait_for(lambda: self.version != version or self.__stopped.is_set(), timeout)
+            return self.version
+
+    def snapshot(self, path: str) -> Tuple[int, Optional[str], Optional[bytes]]:
+        """Version, ETag and JSON body of a resource of the current snapshot, the body is None before the first poll"""
+        with self.__changed:
+            return self.version, self.__etag, self.__bodies.get(path)
+
+    def __devices(self) -> List[WemDevice]:
+        return [device for state in self.accounts.values() for device in state.devices]
+
+    def __render_devices(self) -> Dict:
+        return {username: [_device_json(device) for device in state.devices]
+                for username, state in self.accounts.items()}
+
+    def __render_health(self) -> Dict:
+        return {username: {"updated": state.updated, "error": state.error} for username, state in self.accounts.items()}
+
+    def __poll_forever(self):
+        while not self.__stopped.is_set():
+            started = time.monotonic()
+            try:
+                if self.poll():
+                    LOGGER.debug("Gateway snapshot %s", self.version)
+            except Exception as error:  # pylint: disable=broad-except
+                LOGGER.warning("Gateway poll failed: %s", error)
+            self.__stopped.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> "Gateway":
+        """Poll and serve in background threads"""
+        self.__stopped.clear()
+        self.__threads = [
+            threading.Thread(target=self.__poll_forever, name="wemportal-gateway-poll", daemon=True),
+            threading.Thread(target=self.__server.serve_forever, name="wemportal-gateway", daemon=True),
+        ]
+        for thread in self.__threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Stop polling and serving, waiting consumers are released"""
+        self.__stopped.set()
+        with self.__changed:
+            self.__changed.notify_all()
+        self.__server.shutdown()
+        self.__server.server_close()
+        for thread in self.__threads:
+            thread.join()
+        self.fleet.close()
+
+    @property
+    def stopped(self) -> bool:
+        """Check if stop was called"""
+        return self.__stopped.is_set()
+
+    def serve_forever(self):
+        """Poll and serve until interrupted"""
+        self.start()
+        try:
+            while not self.__stopped.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def __enter__(self) -> "Gateway":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def _handler_for(gateway: Gateway):  # pylint: disable=too-many-statements
+    class Handler(BaseHTTPRequestHandler):
+        """Serve snapshots of the gateway"""
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            LOGGER.debug("Gateway %s - %s", self.address_string(), format % args)
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Handle GET"""
+            url = urlparse(self.path)
+            if url.path == "/events":
+                self._stream_events()
+                return
+
+            if url.path not in gateway.paths:
+                self._send(404, b'{"error": "not found"}')
+                return
+            version, etag, body = gateway.snapshot(url.path)
+            if body is None:
+                retry_after = str(max(1, math.ceil(gateway.interval)))
+                self._send(503, b'{"error": "no data yet"}', headers={"Retry-After": retry_after})
+                return
+
+            if url.path != "/health" and self._not_modified(version, etag):
+                wait = parse_qs(url.query).get("wait")
+                if not wait:
+                    self._send(304, b"", etag)
+                    return
+                try:
+                    timeout = float(wait[0])
+                except ValueError:
+                    timeout = math.nan
+                if not 0 <= timeout < math.inf:
+                    self._send(400, b'{"error": "wait must be a number of seconds"}', etag)
+                    return
+                gateway.wait(version, min(timeout, max_wait))
+                version, etag, body = gateway.snapshot(url.path)
+                if self._not_modified(version, etag):
+                    self._send(304, b"", etag)
+                    return
+
+            self._send(200, body, etag)
+
+        def _not_modified(self, version: int, etag: Optional[str]) -> bool:
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match is not None:
+                return etag in (tag.strip() for tag in if_none_match.split(","))
+            if_modified_since = self.headers.get("If-Modified-Since")
+            if if_modified_since and version == gateway.version:
+                try:
+                    return int(gateway.modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+                except (TypeError, ValueError):
+                    return False
+            return False
+
+        def _send(self, status: int, content: bytes, etag: Optional[str] = None,
+                  headers: Optional[Dict[str, str]] = None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if etag is not None:
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", formatdate(gateway.modified, usegmt=True))
+            self.send_header("Cache-Control", "no-cache")
+            if status != 304:
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            if status != 304:
+                self.wfile.write(content)
+
+        def _stream_events(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            version = -1
+            try:
+                while not gateway.stopped:
+                    if version != gateway.version:
+                        version = gateway.version
+                        self.wfile.write(f"id: {version}\nevent: update\ndata: {{\"version\": {version}}}\n\n".encode())
+                    else:
+                        # Comment line, keeps proxies from closing the idle stream
+                        self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    gateway.wait(version, 15.0)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
@@ -0,0 +1,238 @@
+"""
+Append-only local history of parameter values and statistics
+
+Every series is a file of fixed-width records, a float64 timestamp and a float64 value in native byte order,
+sorted by time. Range reads binary search the memory-mapped file and copy only the requested records.
+"""
+import math
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import quote
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_series import StatisticSeries, to_timestamp
+from wemportal.model.wem_statistic import GraphType, StatisticType
+
+_record_size = 2 * array("d").itemsize
+_suffix = ".f64"
+
+
+def value_key(device_id: int, module_index: int, module_type: int, parameter_id: str) -> str:
+    """Series key of a parameter"""
+    return f"values/{device_id}/{module_index}-{int(module_type)}/{quote(parameter_id, safe='')}"
+
+
+def statistic_key(device_id: int, statistics_type: StatisticType, graph_type: GraphType = GraphType.daily) -> str:
+    """Series key of a statistic"""
+    return f"statistics/{device_id}/{statistics_type.name}-{graph_type.name}"
+
+
+class _MappedSeries:
+    """Read only view of the records of a series file, use as context manager"""
+
+    def __init__(self, path: str):
+        self.__file = open(path, "rb")  # pylint: disable=consider-using-with
+        size = os.fstat(self.__file.fileno()).st_size // _record_size * _record_size
+        self.__mapped = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.__bytes: memoryview = memoryview(self.__mapped)[:size] if self.__mapped else memoryview(b"")
+        self.records: memoryview = self.__bytes.cast("d")
+        # Strided view, bisect works on it without copying
+        self.timestamps: memoryview = self.records[0::2]
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def copy(self, low: int, high: int) -> array:
+        """Copy records low to high, timestamps and values interleaved"""
+        data = array("d")
+        with self.__bytes[low * _record_size:high * _record_size] as view:
+            data.frombytes(view)
+        return data
+
+    def __enter__(self) -> "_MappedSeries":
+        return self
+
+    def __exit__(self, *args):
+        # Views must be released before the map can be closed
+        self.timestamps.release()
+        self.records.release()
+        self.__bytes.release()
+        if self.__mapped is not None:
+            self.__mapped.close()
+        self.__file.close()
+
+
+class HistoryStore:
+    """
+    Local store for the history of parameter values and statistics
+
+    Records are appended in batches, records older than the last record of a series are ignored
+    and a record with the timestamp of the last record replaces it, e.g. the statistic value of the current day.
+
+    Usage::
+
+        store = HistoryStore("~/.local/share/wemportal")
+        devices = api.fetch_devices()
+        store.record_values(devices)
+        store.record_statistics(devices)
+        store.values(device.id, 0, 6, "<ParameterID>", start=datetime.now() - timedelta(days=90), period="day")
+    """
+
+    def __init__(self, directory: str):
+        self.directory: str = os.path.expanduser(directory)
+        self.__pending: Dict[str, array] = {}
+        self.__last: Dict[str, float] = {}
+        self.__lock = threading.RLock()
+
+    def path(self, key: str) -> str:
+        """File of a series"""
+        return os.path.join(self.directory, *key.split("/")) + _suffix
+
+    def keys(self) -> Iterator[str]:
+        """Keys of all stored series"""
+        self.flush()
+        for root, _, files in os.walk(self.directory):
+            for name in sorted(files):
+                if name.endswith(_suffix):
+                    relative = os.path.relpath(os.path.join(root, name[:-len(_suffix)]), self.directory)
+                    yield "/".join(relative.split(os.sep))
+
+    def __last_timestamp(self, key: str) -> float:
+        last = self.__last.get(key)
+        if last is None:
+            last = -math.inf
+            if os.path.exists(self.path(key)):
+                with _MappedSeries(self.path(key)) as series:
+                    if len(series):
+                        last = series.timestamps[-1]
+            self.__last[key] = last
+        return last
+
+    def append(self, key: str, timestamp: float, value: Optional[float]) -> bool:
+        """Buffer a record until the next flush, returns False if it is older than the series"""
+        with self.__lock:
+            last = self.__last_timestamp(key)
+            if timestamp < last:
+                return False
+            value = math.nan if value is None else value
+            pending = self.__pending.setdefault(key, array("d"))
+            if timestamp == last and pending:
+                pending[-1] = value
+            else:
+                pending.extend((timestamp, value))
+            self.__last[key] = timestamp
+            return True
+
+    def flush(self, key: Optional[str] = None):
+        """Write buffered records of a series or of all series, one write per series"""
+        with self.__lock:
+            keys = [key] if key is not None else list(self.__pending)
+            for current in keys:
+                pending = self.__pending.pop(current, None)
+                if pending:
+                    self.__write(current, pending)
+
+    def __write(self, key: str, records: array):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as file:
+            size = file.seek(0, os.SEEK_END) // _record_size * _record_size
+            if size:
+                # Replace the last record if the first new one has its timestamp
+                file.seek(size - _record_size)
+                last = array("d", file.read(_record_size))[0]
+                file.seek(size - _record_size if last == records[0] else size)
+            else:
+                file.seek(0)
+            file.write(records.tobytes())
+            file.truncate()
+
+    def record_values(self, devices: Iterable[WemDevice]) -> int:
+        """Append the values of all parameters that are newer than their history, returns the number of records"""
+        count = 0
+        with self.__lock:
+            for device in devices:
+                for module in device.modules:
+                    for parameter in module.parameters:
+                        value = parameter.value
+                        if value is None or value.time is None:
+                            continue
+                        key = value_key(device.id, module.index, module.type, parameter.parameter_id)
+                        # Without a refresh the portal returns the same value with the same timestamp
+                        timestamp = to_timestamp(value.time)
+                        if timestamp > self.__last_timestamp(key):
+                            count += self.append(key, timestamp, value.numeric_value)
+            self.flush()
+        return count
+
+    def record_statistics(self, devices: Iterable[WemDevice]) -> int:
+        """Append the values of all fetched statistics, returns the number of new or replaced records"""
+        count = 0
+        with self.__lock:
+            for device in devices:
+                for statistic in device.statistics:
+                    key = statistic_key(device.id, statistic.statistics_type, statistic.graph_type)
+                    last = self.__last_timestamp(key)
+                    series = statistic.series
+                    for index in range(bisect_left(series.timestamps, last), len(series)):
+                        count += self.append(key, series.timestamps[index], series.values[index])
+            self.flush()
+        return count
+
+    def read(self, key: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             period: Optional[str] = None, how: str = "mean") -> StatisticSeries:
+        """
+        Records with start <= date <= end, aggregated per hour, day, month or year with sum, mean, min or max
+        if period is set
+        """
+        # pylint: disable=too-many-arguments
+        self.flush(key)
+        path = self.path(key)
+        if not os.path.exists(path):
+            return StatisticSeries()
+        with _MappedSeries(path) as series:
+            low = 0 if start is None else bisect_left(series.timestamps, to_timestamp(start))
+            high = len(series) if end is None else bisect_right(series.timestamps, to_timestamp(end))
+            data = series.copy(low, max(low, high))
+        result = StatisticSeries(data[0::2], data[1::2])
+        return result.resample(period, how) if period else result
+
+    def values(self, device_id: int, module_index: int, module_type: int, parameter_id: str,
+               start: Optional[datetime] = None, end: Optional[datetime] = None,
+               period: Optional[str] = None, how: str = "mean") -> StatisticSeries:
+        """History of a parameter, see read()"""
+        # pylint: disable=too-many-arguments
+        return self.read(value_key(device_id, module_index, module_type, parameter_id), start, end, period, how)
+
+    def statistics(self, device_id: int, statistics_type: StatisticType, graph_type: GraphType = GraphType.daily,
+                   start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   period: Optional[str] = None, how: str = "sum") -> StatisticSeries:
+        """History of a statistic, see read()"""
+        # pylint: disable=too-many-arguments
+        return self.read(statistic_key(device_id, statistics_type, graph_type), start, end, period, how)
+
+    def compact(self, retention: timedelta, now: Optional[datetime] = None) -> Tuple[int, int]:
+        """Drop records older than retention, returns the number of rewritten series and dropped records"""
+        cutoff = to_timestamp((now or datetime.now()) - retention)
+        rewritten = dropped = 0
+        with self.__lock:
+            for key in list(self.keys()):
+                path = self.path(key)
+                with _MappedSeries(path) as series:
+                    low = bisect_left(series.timestamps, cutoff)
+                    if not low:
+                        continue
+                    kept = series.copy(low, len(series))
+                # Write a new file and swap it in, readers keep their map of the old one
+                with open(path + ".tmp", "wb") as file:
+                    file.write(kept.tobytes())
+                os.replace(path + ".tmp", path)
+                if not kept:
+                    self.__last.pop(key, None)
+                rewritten += 1
+                dropped += low
+        return rewritten, dropped
@@ -0,0 +1,305 @@
+"""
+Instrumentation hooks for portal requests and parsing, and a collector rendering Prometheus metrics
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Device the current thread or task works on, attached to request and parse events
+_current_device: ContextVar[Optional[int]] = ContextVar("wemportal_device", default=None)
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class RequestEvent:
+    # pylint: disable=too-many-instance-attributes
+    """A single attempt of a portal request, attempt counts retries from 0"""
+    method: str
+    endpoint: str
+    status: Optional[int]
+    response_bytes: int
+    latency: float
+    attempt: int = 0
+    device_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ParseEvent:
+    """Parsing of portal data by one of the parsers"""
+    parser: str
+    items: int
+    duration: float
+    device_id: Optional[int] = None
+
+
+@dataclass
+class RunEvent:
+    """End of a fetch_devices run"""
+    name: str
+    duration: float
+    devices: int
+    error: Optional[str] = None
+
+
+Event = Union[RequestEvent, ParseEvent, RunEvent]
+Listener = Callable[[Event], None]
+
+
+class Instrumentation:
+    """
+    Dispatch events to subscribed listeners. Without listeners no events are created.
+    Listeners are called synchronously in the requesting thread and must be thread safe.
+    """
+
+    def __init__(self, listeners: Sequence[Listener] = ()):
+        self.listeners: List[Listener] = list(listeners)
+
+    @property
+    def enabled(self) -> bool:
+        """Check if any listener is subscribed"""
+        return bool(self.listeners)
+
+    def subscribe(self, listener: Listener):
+        """Add a listener, called with every event"""
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Listener):
+        """Remove a listener"""
+        self.listeners.remove(listener)
+
+    def emit(self, event: Event):
+        """Send an event to all listeners"""
+        for listener in self.listeners:
+            listener(event)
+
+    def request(self, method: str, endpoint: str, status: Optional[int], response_bytes: int,
+                latency: float, attempt: int = 0, error: Optional[str] = None):
+        """Emit a RequestEvent for the current device"""
+        # pylint: disable=too-many-arguments
+        if self.listeners:
+            self.emit(RequestEvent(method, endpoint, status, response_bytes, latency, attempt,
+                                   _current_device.get(), error))
+
+    @contextmanager
+    def parse(self, parser: str, items: int = 1) -> Iterator[None]:
+        """Time the parsing inside the block"""
+        if not self.listeners:
+            yield
+            return
+        start = time.perf_counter()
+        yield
+        self.emit(ParseEvent(parser, items, time.perf_counter() - start, _current_device.get()))
+
+    @staticmethod
+    @contextmanager
+    def device(device_id: int) -> Iterator[None]:
+        """Attribute events inside the block to a device"""
+        token = _current_device.set(device_id)
+        try:
+            yield
+        finally:
+            _current_device.reset(token)
+
+    @contextmanager
+    def run(self, name: str) -> Iterator[List]:
+        """Time a fetch run, append the fetched devices to the yielded list"""
+        if not self.listeners:
+            yield []
+            return
+        start = time.perf_counter()
+        devices: List = []
+        try:
+            yield devices
+        except Exception as error:
+            self.emit(RunEvent(name, time.perf_counter() - start, len(devices), error=type(error).__name__))
+            raise
+        self.emit(RunEvent(name, time.perf_counter() - start, len(devices)))
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds"""
+
+    def __init__(self, buckets: Sequence[float] = default_buckets):
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        """Record a value"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        """Yield the le label and cumulative count of every bucket including +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), total
+
+
+@dataclass
+class _RunTotals:
+    # pylint: disable=too-many-instance-attributes
+    requests: int = 0
+    response_bytes: int = 0
+    retries: int = 0
+    errors: int = 0
+    request_time: Dict[str, float] = field(default_factory=dict)
+    request_count: Dict[str, int] = field(default_factory=dict)
+    parse_time: Dict[str, float] = field(default_factory=dict)
+    parse_items: Dict[str, int] = field(default_factory=dict)
+
+
+class MetricsCollector:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Listener aggregating events into histograms and counters
+
+    Usage::
+
+        collector = MetricsCollector()
+        api = WemPortal("user", "password", instrumentation=Instrumentation([collector]))
+        api.fetch_devices()
+        collector.last_run  # summary of the fetch
+        collector.render_prometheus()
+    """
+
+    def __init__(self, buckets: Sequence[float] = default_buckets):
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.request_duration: Dict[Tuple[str, str, str], Histogram] = {}
+        self.response_bytes: Dict[str, int] = {}
+        self.retries: Dict[str, int] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.parse_duration: Dict[str, Histogram] = {}
+        self.parsed_items: Dict[str, int] = {}
+        self.run_duration: Dict[str, Histogram] = {}
+        self.last_run: Optional[Dict] = None
+        self.__run: _RunTotals = _RunTotals()
+        self.__lock = threading.Lock()
+
+    def __call__(self, event: Event):
+        with self.__lock:
+            if isinstance(event, RequestEvent):
+                self.__record_request(event)
+            elif isinstance(event, ParseEvent):
+                self.__record_parse(event)
+            elif isinstance(event, RunEvent):
+                self.__record_run(event)
+
+    def __histogram(self, histograms: Dict, key) -> Histogram:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def __record_request(self, event: RequestEvent):
+        status = str(event.status) if event.status is not None else "none"
+        self.__histogram(self.request_duration, (event.endpoint, event.method, status)).observe(event.latency)
+        self.response_bytes[event.endpoint] = self.response_bytes.get(event.endpoint, 0) + event.response_bytes
+        run = self.__run
+        run.requests += 1
+        run.response_bytes += event.response_bytes
+        run.request_time[event.endpoint] = run.request_time.get(event.endpoint, 0.0) + event.latency
+        run.request_count[event.endpoint] = run.request_count.get(event.endpoint, 0) + 1
+        if event.attempt:
+            self.retries[event.endpoint] = self.retries.get(event.endpoint, 0) + 1
+            run.retries += 1
+        if event.error or event.status is None or event.status >= 500:
+            key = (event.endpoint, event.error or status)
+            self.errors[key] = self.errors.get(key, 0) + 1
+            run.errors += 1
+
+    def __record_parse(self, event: ParseEvent):
+        self.__histogram(self.parse_duration, event.parser).observe(event.duration)
+        self.parsed_items[event.parser] = self.parsed_items.get(event.parser, 0) + event.items
+        run = self.__run
+        run.parse_time[event.parser] = run.parse_time.get(event.parser, 0.0) + event.duration
+        run.parse_items[event.parser] = run.parse_items.get(event.parser, 0) + event.items
+
+    def __record_run(self, event: RunEvent):
+        self.__histogram(self.run_duration, event.name).observe(event.duration)
+        self.last_run = self.__summarize(self.__run, event)
+        self.__run = _RunTotals()
+
+    @staticmethod
+    def __summarize(run: _RunTotals, event: RunEvent) -> Dict:
+        return {
+            "name": event.name,
+            "duration_s": event.duration,
+            "devices": event.devices,
+            "error": event.error,
+            "requests": run.requests,
+            "response_bytes": run.response_bytes,
+            "retries": run.retries,
+            "errors": run.errors,
+            "request_time_s": sum(run.request_time.values()),
+            "parse_time_s": sum(run.parse_time.values()),
+            "endpoints": {
+                endpoint: {"requests": run.request_count[endpoint], "time_s": run.request_time[endpoint]}
+                for endpoint in sorted(run.request_time)
+            },
+            "parsers": {
+                parser: {"items": run.parse_items[parser], "time_s": run.parse_time[parser]}
+                for parser in sorted(run.parse_time)
+            },
+        }
+
+    def summary(self) -> Dict:
+        """Summary of the events since the last finished run"""
+        with self.__lock:
+            return self.__summarize(self.__run, RunEvent("current", 0.0, 0))
+
+    def render_prometheus(self, prefix: str = "wemportal") -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self.__lock:
+            _render_histograms(lines, f"{prefix}_request_duration_seconds", "Latency of portal requests",
+                               ("endpoint", "method", "status"), self.request_duration)
+            _render_counters(lines, f"{prefix}_response_bytes_total", "Bytes received from the portal",
+                             ("endpoint",), self.response_bytes)
+            _render_counters(lines, f"{prefix}_request_retries_total", "Retried portal requests",
+                             ("endpoint",), self.retries)
+            _render_counters(lines, f"{prefix}_request_errors_total", "Failed portal requests",
+                             ("endpoint", "error"), self.errors)
+            _render_histograms(lines, f"{prefix}_parse_duration_seconds", "Time spent parsing portal data",
+                               ("parser",), self.parse_duration)
+            _render_counters(lines, f"{prefix}_parsed_items_total", "Items parsed from portal data",
+                             ("parser",), self.parsed_items)
+            _render_histograms(lines, f"{prefix}_run_duration_seconds", "Duration of fetch runs",
+                               ("run",), self.run_duration)
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names: Sequence[str], values) -> str:
+    if isinstance(values, str):
+        values = (values,)
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+def _render_counters(lines: List[str], name: str, description: str, label_names: Sequence[str], counters: Dict):
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} counter")
+    for key in sorted(counters):
+        lines.append(f"{name}{{{_labels(label_names, key)}}} {counters[key]}")
+
+
+def _render_histograms(lines: List[str], name: str, description: str, label_names: Sequence[str],
+                       histograms: Dict[object, Histogram]):
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} histogram")
+    for key in sorted(histograms):
+        labels = _labels(label_names, key)
+        histogram = histograms[key]
+        for bound, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
@@ -0,0 +1,208 @@
+# pylint: disable=too-few-public-methods,duplicate-code
+"""
+Slotted variants of the model classes for services holding large fleets
+
+The variants have the same public attributes as WemDevice, WemModule, WemParameter, EnumValue and WemValue,
+but no per instance __dict__. Their parsers share equal enum value lists, names, units and timestamps
+between all objects, so shared enum value lists are immutable tuples.
+"""
+import datetime
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from wemportal.model.wem_device import ConnectionStatus, DeviceType, StatisticLoader, WemDevice, _Statistic
+from wemportal.model.wem_module import ModuleType, WemModule
+from wemportal.model.wem_parameter import DataType, WemParameter
+from wemportal.model.wem_statistic import StatisticType
+
+# Interned enum value lists, keyed by their (value, name) pairs
+_enum_values: Dict[Tuple[Tuple[int, str], ...], Tuple["CompactEnumValue", ...]] = {}
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(frozen=True)
+class CompactEnumValue:
+    """Slotted, immutable EnumValue"""
+    __slots__ = ("value", "name")
+    value: int
+    name: str
+
+
+@dataclass
+class CompactWemValue:
+    # pylint: disable=too-many-instance-attributes
+    """Slotted WemValue"""
+    __slots__ = ("unit", "time", "numeric_value", "string_value", "dynamisation", "parameter_id")
+    unit: str
+    time: datetime.datetime
+    numeric_value: float
+    string_value: str
+    dynamisation: bool
+    parameter_id: str
+
+
+@dataclass
+class CompactWemParameter:
+    # pylint: disable=too-many-instance-attributes
+    """Slotted WemParameter, enum_values is a shared tuple"""
+    __slots__ = ("parameter_id", "name", "data_type", "min_value", "max_value", "default_value",
+                 "is_readable", "is_writeable", "enum_values", "value")
+    parameter_id: str
+    name: str
+    data_type: DataType
+    min_value: Optional[float]
+    max_value: Optional[float]
+    default_value: Optional[float]
+    is_readable: bool
+    is_writeable: bool
+    enum_values: Tuple[CompactEnumValue, ...]
+    value: Optional[CompactWemValue]
+
+    validate = WemParameter.validate
+
+
+@dataclass
+class CompactWemModule:
+    # pylint: disable=too-many-instance-attributes
+    """Slotted WemModule"""
+    __slots__ = ("index", "custom_numbering", "name", "type", "dynamisation", "fwu_version", "parameters",
+                 "_parameter_index", "_indexed_parameters")
+    index: int
+    custom_numbering: int
+    name: str
+    type: ModuleType
+    dynamisation: bool
+    fwu_version: str
+    parameters: List[CompactWemParameter]
+
+    def __post_init__(self):
+        self._parameter_index: Dict[str, CompactWemParameter] = {}
+        self._indexed_parameters: Optional[List[CompactWemParameter]] = None
+
+    reindex = WemModule.reindex
+    get_parameter = WemModule.get_parameter
+
+
+@dataclass
+class CompactWemDevice:
+    # pylint: disable=too-many-instance-attributes
+    """Slotted WemDevice, statistics are not part of repr and comparison"""
+    __slots__ = ("id", "name", "device_type", "modules", "connection_status", "has_errors", "statistic_loader",
+                 "_heating_statistic", "_hot_water_statistic", "_summary_statistic", "_defrost_statistic",
+                 "_cooling_statistic", "_module_index", "_indexed_modules")
+    id: int
+    name: str
+    device_type: DeviceType
+    modules: List[CompactWemModule]
+    connection_status: ConnectionStatus
+    has_errors: bool
+
+    # Not annotated, so they are descriptors and no dataclass fields
+    heating_statistic = _Statistic(StatisticType.heating)
+    hot_water_statistic = _Statistic(StatisticType.hot_water)
+    summary_statistic = _Statistic(StatisticType.summary)
+    defrost_statistic = _Statistic(StatisticType.defrost)
+    cooling_statistic = _Statistic(StatisticType.cooling)
+
+    def __post_init__(self):
+        self.statistic_loader: Optional[StatisticLoader] = None
+        self._module_index: Dict[Tuple[int, int], CompactWemModule] = {}
+        self._indexed_modules: Optional[List[CompactWemModule]] = None
+
+    reindex = WemDevice.reindex
+    get_module = WemDevice.get_module
+    get_parameter = WemDevice.get_parameter
+    statistics = WemDevice.statistics
+    get_parameter_query = WemDevice.get_parameter_query
+    get_parameter_values = WemDevice.get_parameter_values
+    get_write_query = WemDevice.get_write_query
+
+
+class CompactEnumValueParser:
+    """Parser for shared enum value lists"""
+    @staticmethod
+    def load(enum_values: Optional[List[Dict]]) -> Tuple[CompactEnumValue, ...]:
+        """Load an enum value list, equal lists return the same tuple"""
+        key = tuple((enum_value["Value"], enum_value["Name"]) for enum_value in enum_values or ())
+        shared = _enum_values.get(key)
+        if shared is None:
+            shared = _enum_values.setdefault(
+                key, tuple(CompactEnumValue(value=value, name=_intern(name)) for value, name in key)
+            )
+        return shared
+
+
+class CompactWemParameterParser:
+    """Parser for CompactWemParameter"""
+    @staticmethod
+    def load(parameter: Dict) -> CompactWemParameter:
+        """Load CompactWemParameter from Dict"""
+        return CompactWemParameter(
+            parameter_id=_intern(parameter["ParameterID"]),
+            name=_intern(parameter["Name"]),
+            data_type=DataType(parameter["DataType"]),
+            min_value=parameter["MinValue"],
+            max_value=parameter["MaxValue"],
+            default_value=parameter["DefaultValue"],
+            is_readable=parameter["IsReadable"],
+            is_writeable=parameter["IsWriteable"],
+            enum_values=CompactEnumValueParser.load(parameter["EnumValues"]),
+            value=None
+        )
+
+
+@lru_cache(maxsize=1024)
+def _from_timestamp(timestamp: int) -> datetime.datetime:
+    # Values of one response mostly share their timestamp
+    return datetime.datetime.fromtimestamp(timestamp)
+
+
+class CompactWemValueParser:
+    """Parser for CompactWemValue"""
+    @staticmethod
+    def load(value: Dict) -> CompactWemValue:
+        """Load CompactWemValue from Dict"""
+        return CompactWemValue(
+            unit=_intern(value["Unit"]),
+            time=_from_timestamp(int(value["Timestamp"])),
+            numeric_value=value["NumericValue"],
+            string_value=value["StringValue"],
+            dynamisation=value["Dynamisation"],
+            parameter_id=_intern(value["ParameterID"])
+        )
+
+
+class CompactWemModuleParser:
+    """Parser for CompactWemModule"""
+    @staticmethod
+    def load(module: Dict) -> CompactWemModule:
+        """Load CompactWemModule from Dict"""
+        return CompactWemModule(
+            index=module["Index"],
+            custom_numbering=module["CustomNumbering"],
+            name=_intern(module["Name"]),
+            type=ModuleType(module["Type"]),
+            dynamisation=module["Dynamisation"],
+            fwu_version=_intern(module["FWUVersion"]),
+            parameters=[]
+        )
+
+
+class CompactWemDeviceParser:
+    """Parser for CompactWemDevice"""
+    @staticmethod
+    def load(device: Dict) -> CompactWemDevice:
+        """Load CompactWemDevice from dict"""
+        return CompactWemDevice(
+            id=device["ID"],
+            name=device["Name"],
+            device_type=DeviceType(device["DeviceType"]),
+            modules=[CompactWemModuleParser.load(module) for module in device["Modules"]],
+            connection_status=ConnectionStatus(device["ConnectionStatus"]),
+            has_errors=device["HasErrors"]
+        )
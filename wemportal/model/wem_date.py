@@ -0,0 +1,40 @@
+"""
+Fast parsing of dates returned by wemportal
+"""
+from datetime import datetime
+from functools import lru_cache
+
+# Known portal formats not covered by datetime.fromisoformat on every supported python version
+_formats = (
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y",
+)
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value: str) -> datetime:
+    """
+    Parse a portal date, falling back to dateutil for unknown formats.
+    Results are memoized, statistics repeat the same dates on every poll.
+    """
+    text = value.strip()
+    if text.endswith("Z"):
+        text = f"{text[:-1]}+00:00"
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+
+    for date_format in _formats:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+
+    # dateutil is slow to import and to parse, only load it when needed
+    from dateutil import parser  # pylint: disable=import-outside-toplevel
+    return parser.parse(value)
@@ -1,12 +1,15 @@
 """
 Main data structures for WEM Devices
 """
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import IntEnum
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Protocol, Tuple, Union
 
+from wemportal.exceptions import ParameterValueError
 from wemportal.model.wem_module import WemModule, WemModuleParser
-from wemportal.model.wem_statistic import WemHeatingStatistic, WemHotWaterStatistic, WemSummaryStatistic, WemDefrostStatistic, WemCoolingStatistic
+from wemportal.model.wem_parameter import WemParameter
+from wemportal.model.wem_statistic import StatisticType, WemStatistic, WemHeatingStatistic, WemHotWaterStatistic, \
+    WemSummaryStatistic, WemDefrostStatistic, WemCoolingStatistic
 
 class DeviceType(IntEnum):
     """
@@ -26,6 +29,47 @@ class ConnectionStatus(IntEnum):
     wrong_secret = 7
 
 
+class StatisticLoader(Protocol):
+    # pylint: disable=too-few-public-methods
+    """Loads statistics of a device on access, see WemDevice.statistic_loader"""
+
+    def refresh(self, device: "WemDevice", statistics_type: StatisticType):
+        """Fetch the statistic and assign it to the device if it is missing or outdated"""
+
+
+class _Statistic:
+    """
+    Descriptor for statistic attributes, asks the statistic loader of the device before returning a value
+    """
+
+    def __init__(self, statistics_type: StatisticType):
+        self.statistics_type: StatisticType = statistics_type
+        self.name: str = ""
+
+    def __set_name__(self, owner, name: str):
+        self.name = f"_{name}"
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        loader = getattr(instance, "statistic_loader", None)
+        if loader is not None:
+            loader.refresh(instance, self.statistics_type)
+        return getattr(instance, self.name, None)
+
+    def __set__(self, instance, value):
+        # The descriptor itself is the default of the dataclass field
+        if value is self:
+            value = None
+        # Stored in __dict__ or, for slotted devices, in a slot of the same name
+        setattr(instance, self.name, value)
+
+
+def _statistic_field(statistics_type: StatisticType):
+    """Dataclass field for a statistic attribute, left out of repr and comparison so they do not load statistics"""
+    return field(default=_Statistic(statistics_type), repr=False, compare=False)
+
+
 @dataclass
 class WemDevice():
     # pylint: disable=too-many-instance-attributes
@@ -38,32 +82,90 @@ class WemDevice():
     modules: List[WemModule]
     connection_status: ConnectionStatus
     has_errors: bool
-    heating_statistic: Optional[WemHeatingStatistic]
-    hot_water_statistic: Optional[WemHotWaterStatistic]
-    summary_statistic: Optional[WemSummaryStatistic]
-    defrost_statistic: Optional[WemDefrostStatistic]
-    cooling_statistic: Optional[WemCoolingStatistic]
-
-    def get_parameter_query(self):
-        """Build query for parameters"""
+    heating_statistic: Optional[WemHeatingStatistic] = _statistic_field(StatisticType.heating)
+    hot_water_statistic: Optional[WemHotWaterStatistic] = _statistic_field(StatisticType.hot_water)
+    summary_statistic: Optional[WemSummaryStatistic] = _statistic_field(StatisticType.summary)
+    defrost_statistic: Optional[WemDefrostStatistic] = _statistic_field(StatisticType.defrost)
+    cooling_statistic: Optional[WemCoolingStatistic] = _statistic_field(StatisticType.cooling)
+    statistic_loader: Optional[StatisticLoader] = field(default=None, repr=False, compare=False)
+    _module_index: Dict[Tuple[int, int], WemModule] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _indexed_modules: Optional[List[WemModule]] = field(default=None, init=False, repr=False, compare=False)
+
+    def reindex(self):
+        """Rebuild the module index"""
+        self._module_index = {(module.index, int(module.type)): module for module in self.modules}
+        self._indexed_modules = self.modules
+
+    def get_module(self, module_index: int, module_type: int) -> Optional[WemModule]:
+        """Get module by index and type"""
+        if self._indexed_modules is not self.modules or len(self._module_index) != len(self.modules):
+            self.reindex()
+        return self._module_index.get((module_index, int(module_type)))
+
+    def get_parameter(self, module_index: int, module_type: int, parameter_id: str) -> Optional[WemParameter]:
+        """Get parameter by module index, module type and parameter id"""
+        module = self.get_module(module_index, module_type)
+        return module.get_parameter(parameter_id) if module else None
+
+    @property
+    def statistics(self) -> List[WemStatistic]:
+        """All fetched statistics, a statistic loader loads all of them"""
+        return [
+            statistic for statistic in (self.heating_statistic, self.hot_water_statistic, self.summary_statistic,
+                                        self.defrost_statistic, self.cooling_statistic)
+            if statistic is not None
+        ]
+
+    def get_parameter_query(self, selector: Optional[Callable[[WemModule, WemParameter], bool]] = None):
+        """Build query for parameters, optionally only for parameters accepted by selector"""
         data = {
             "DeviceID": self.id,
             "Modules": []
         }
 
         for module in self.modules:
-            if module.parameters:
+            parameters = [
+                {"ParameterID": parameter.parameter_id}
+                for parameter in module.parameters
+                if selector is None or selector(module, parameter)
+            ]
+            if parameters:
                 data["Modules"].append({
                     "ModuleIndex": module.index,
                     "ModuleType": int(module.type),
-                    "Parameters": [
-                        {"ParameterID": parameter.parameter_id}
-                        for parameter in module.parameters
-                    ],
+                    "Parameters": parameters,
                 })
 
         return data
 
+    def get_write_query(self, values: Dict[Tuple[int, int, str], Union[float, str]]) -> Dict:
+        """
+        Build write query for values keyed by module index, module type and parameter id, grouped by module.
+        Raises ParameterValueError for unknown or read only parameters and invalid values.
+        """
+        modules: Dict[Tuple[int, int], List[Dict]] = {}
+        for (module_index, module_type, parameter_id), value in values.items():
+            parameter = self.get_parameter(module_index, module_type, parameter_id)
+            if parameter is None:
+                raise ParameterValueError(
+                    f"Unknown parameter {parameter_id} in module {module_index}/{module_type} of device {self.id}"
+                )
+            numeric = parameter.validate(value)
+            modules.setdefault((module_index, int(module_type)), []).append({
+                "ParameterID": parameter_id,
+                "NumericValue": numeric,
+                # The numeric text the portal echoes, also for enum names
+                "StringValue": _format_number(numeric),
+            })
+
+        return {
+            "DeviceID": self.id,
+            "Modules": [
+                {"ModuleIndex": module_index, "ModuleType": module_type, "Parameters": parameters}
+                for (module_index, module_type), parameters in modules.items()
+            ],
+        }
+
     def get_parameter_values(self):
         """Get flat list of parameters and values"""
         result = []
@@ -93,6 +195,11 @@ class WemDevice():
         return result
 
 
+def _format_number(value: float) -> str:
+    """Text of a number without rounding, whole numbers without decimals"""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
 class WemDeviceParser:
     # pylint: disable=too-few-public-methods
     """Parser for WEM Devices"""
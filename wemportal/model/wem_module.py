@@ -1,9 +1,9 @@
 """
 Manage WEM Modules
 """
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import IntEnum
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from wemportal.model.wem_parameter import WemParameter
 
@@ -28,6 +28,7 @@ class ModuleType(IntEnum):
 
 @dataclass
 class WemModule:
+    # pylint: disable=too-many-instance-attributes
     """
     Class for WEM Modules
     """
@@ -38,6 +39,19 @@ class WemModule:
     dynamisation: bool
     fwu_version: str
     parameters: List[WemParameter]
+    _parameter_index: Dict[str, WemParameter] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _indexed_parameters: Optional[List[WemParameter]] = field(default=None, init=False, repr=False, compare=False)
+
+    def reindex(self):
+        """Rebuild the parameter index"""
+        self._parameter_index = {parameter.parameter_id: parameter for parameter in self.parameters}
+        self._indexed_parameters = self.parameters
+
+    def get_parameter(self, parameter_id: str) -> Optional[WemParameter]:
+        """Get parameter by id"""
+        if self._indexed_parameters is not self.parameters or len(self._parameter_index) != len(self.parameters):
+            self.reindex()
+        return self._parameter_index.get(parameter_id)
 
 
 class WemModuleParser:
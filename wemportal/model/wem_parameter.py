@@ -2,10 +2,12 @@
 """
 Manage WEM Parameters
 """
+import math
 from dataclasses import dataclass
 from enum import IntEnum
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 
+from wemportal.exceptions import ParameterValueError
 from wemportal.model.wem_value import WemValue
 
 
@@ -51,6 +53,30 @@ class WemParameter:
     enum_values: List[EnumValue]
     value: Optional[WemValue]
 
+    def validate(self, value: Union[float, str]) -> float:
+        """
+        Numeric value to write, enum parameters accept the value or name of an enum value.
+        Raises ParameterValueError for read only parameters and values out of range.
+        """
+        if not self.is_writeable:
+            raise ParameterValueError(f"Parameter {self.parameter_id} is not writeable")
+        if self.enum_values:
+            for enum_value in self.enum_values:
+                if value in (enum_value.value, enum_value.name):
+                    return float(enum_value.value)
+            names = ", ".join(f"{enum_value.value}={enum_value.name}" for enum_value in self.enum_values)
+            raise ParameterValueError(f"Parameter {self.parameter_id} accepts {names}, not {value!r}")
+        try:
+            numeric = float(value)
+        except (TypeError, ValueError):
+            raise ParameterValueError(f"Parameter {self.parameter_id} needs a number, not {value!r}") from None
+        if (math.isnan(numeric) or (self.min_value is not None and numeric < self.min_value)
+                or (self.max_value is not None and numeric > self.max_value)):
+            raise ParameterValueError(
+                f"Parameter {self.parameter_id} accepts {self.min_value} to {self.max_value}, not {value!r}"
+            )
+        return numeric
+
 
 class WemParameterParser:
     """Parser for WEM Parameters"""
@@ -0,0 +1,175 @@
+"""
+Compact array backed time series for statistics
+"""
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone, tzinfo as TzInfo
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_epoch = datetime(1970, 1, 1)
+
+
+def to_timestamp(date: datetime) -> float:
+    """Seconds since epoch of a naive portal date, aware dates are converted to UTC"""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return (date - _epoch).total_seconds()
+
+
+def from_timestamp(timestamp: float, tzinfo: Optional[TzInfo] = None) -> datetime:
+    """Naive portal date of seconds since epoch, or the aware date in tzinfo"""
+    date = _epoch + timedelta(seconds=timestamp)
+    return date if tzinfo is None else date.replace(tzinfo=timezone.utc).astimezone(tzinfo)
+
+
+# Aggregations of the present values of a period, missing values are stored as nan and skipped
+_aggregations: Dict[str, Callable[[List[float]], float]] = {
+    "sum": math.fsum,
+    "mean": lambda values: math.fsum(values) / len(values),
+    "min": min,
+    "max": max,
+}
+
+
+def _present(values: Iterable[float]) -> List[float]:
+    """Values without the nan of missing values"""
+    return [value for value in values if not math.isnan(value)]
+
+
+_periods: Dict[str, Callable[[datetime], datetime]] = {
+    "hour": lambda date: date.replace(minute=0, second=0, microsecond=0),
+    "day": lambda date: date.replace(hour=0, minute=0, second=0, microsecond=0),
+    "month": lambda date: date.replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+    "year": lambda date: date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+# Start of the period following the period starting at date
+_next_periods: Dict[str, Callable[[datetime], datetime]] = {
+    "hour": lambda date: date + timedelta(hours=1),
+    "day": lambda date: date + timedelta(days=1),
+    "month": lambda date: date.replace(year=date.year + date.month // 12, month=date.month % 12 + 1),
+    "year": lambda date: date.replace(year=date.year + 1),
+}
+
+
+class StatisticSeries:
+    """
+    Time series of statistic values stored in two contiguous float arrays sorted by time.
+    Aware dates are stored as UTC and returned in tzinfo, the time zone of the first aware date appended.
+    """
+    __slots__ = ("timestamps", "values", "tzinfo")
+
+    def __init__(self, timestamps: Iterable[float] = (), values: Iterable[float] = (),
+                 tzinfo: Optional[TzInfo] = None):
+        self.timestamps: array = array("d", timestamps)
+        self.values: array = array("d", values)
+        self.tzinfo: Optional[TzInfo] = tzinfo
+        if len(self.timestamps) != len(self.values):
+            raise ValueError("timestamps and values must have the same length")
+
+    @classmethod
+    def from_points(cls, points: Iterable[Tuple[datetime, Optional[float]]]) -> "StatisticSeries":
+        """Build series from (date, value) pairs, missing values are stored as nan"""
+        series = cls()
+        for date, value in points:
+            series.append(date, value)
+        timestamps = series.timestamps
+        if any(timestamps[i] > timestamps[i + 1] for i in range(len(timestamps) - 1)):
+            order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+            series = cls((timestamps[i] for i in order), (series.values[i] for i in order), series.tzinfo)
+        return series
+
+    def append(self, date: datetime, value: Optional[float]):
+        """Append a value, dates must be appended in ascending order"""
+        if self.tzinfo is None and date.tzinfo is not None:
+            self.tzinfo = date.tzinfo
+        self.timestamps.append(to_timestamp(date))
+        self.values.append(math.nan if value is None else value)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, StatisticSeries):
+            return NotImplemented
+        return self.timestamps == other.timestamps and self.values == other.values
+
+    def __repr__(self) -> str:
+        return f"StatisticSeries(len={len(self)})"
+
+    def datetime(self, index: int) -> datetime:
+        """Date of the value at index"""
+        return from_timestamp(self.timestamps[index], self.tzinfo)
+
+    def points(self) -> Iterator[Tuple[datetime, float]]:
+        """Iterate (date, value) pairs"""
+        for timestamp, value in zip(self.timestamps, self.values):
+            yield from_timestamp(timestamp, self.tzinfo), value
+
+    def buffers(self) -> Tuple[memoryview, memoryview]:
+        """Zero-copy views of timestamps and values"""
+        return memoryview(self.timestamps), memoryview(self.values)
+
+    def to_numpy(self):
+        """Zero-copy numpy arrays of timestamps and values, requires numpy"""
+        try:
+            import numpy  # pylint: disable=import-outside-toplevel
+        except ImportError as error:
+            raise ImportError("numpy is required for StatisticSeries.to_numpy()") from error
+        return (numpy.frombuffer(self.timestamps, dtype=numpy.float64),
+                numpy.frombuffer(self.values, dtype=numpy.float64))
+
+    def between(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> "StatisticSeries":
+        """Values with start <= date <= end"""
+        low = 0 if start is None else bisect_left(self.timestamps, to_timestamp(start))
+        high = len(self) if end is None else bisect_right(self.timestamps, to_timestamp(end))
+        return StatisticSeries(self.timestamps[low:high], self.values[low:high], self.tzinfo)
+
+    def merge(self, other: "StatisticSeries") -> "StatisticSeries":
+        """Merge two series, values of other win for equal dates"""
+        merged = dict(zip(self.timestamps, self.values))
+        merged.update(zip(other.timestamps, other.values))
+        timestamps = sorted(merged)
+        return StatisticSeries(timestamps, (merged[timestamp] for timestamp in timestamps), self.tzinfo or other.tzinfo)
+
+    def sum(self) -> float:
+        """Sum of all present values, missing values are skipped"""
+        return math.fsum(_present(self.values))
+
+    def mean(self) -> Optional[float]:
+        """Mean of all present values, None if no value is present"""
+        return self.__aggregate("mean")
+
+    def min(self) -> Optional[float]:
+        """Minimum of all present values, None if no value is present"""
+        return self.__aggregate("min")
+
+    def max(self) -> Optional[float]:
+        """Maximum of all present values, None if no value is present"""
+        return self.__aggregate("max")
+
+    def __aggregate(self, how: str) -> Optional[float]:
+        values = _present(self.values)
+        return _aggregations[how](values) if values else None
+
+    def resample(self, period: str, how: str = "sum") -> "StatisticSeries":
+        """
+        Aggregate values per hour, day, month or year with sum, mean, min or max.
+        Missing values are skipped, a period without present values is missing as well.
+        """
+        truncate = _periods[period]
+        next_period = _next_periods[period]
+        aggregate = _aggregations[how]
+        result = StatisticSeries(tzinfo=self.tzinfo)
+        start = 0
+        # Only period boundaries are converted to dates, the values of a period are found by binary search.
+        # Periods of aware series start in their time zone
+        while start < len(self):
+            bucket = truncate(from_timestamp(self.timestamps[start], self.tzinfo))
+            end = bisect_left(self.timestamps, to_timestamp(next_period(bucket)), start)
+            values = _present(self.values[start:end])
+            result.append(bucket, aggregate(values) if values else None)
+            start = end
+        return result
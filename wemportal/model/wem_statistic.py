@@ -5,8 +5,9 @@ Classes for statistics management
 from dataclasses import dataclass
 from datetime import datetime
 from enum import IntEnum
-from typing import List, Dict
-from dateutil import parser
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union, overload
+from wemportal.model.wem_date import parse_date
+from wemportal.model.wem_series import StatisticSeries
 
 
 class StatisticType(IntEnum):
@@ -36,6 +37,34 @@ class StatisticValue():
     value: float
 
 
+class StatisticValues(Sequence):
+    """Read only view yielding StatisticValue objects of a series"""
+
+    def __init__(self, series: StatisticSeries):
+        self.__series = series
+
+    def __len__(self) -> int:
+        return len(self.__series)
+
+    @overload
+    def __getitem__(self, index: int) -> StatisticValue: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[StatisticValue]: ...
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return StatisticValue(datetime=self.__series.datetime(index), value=self.__series.values[index])
+
+    def __iter__(self) -> Iterator[StatisticValue]:
+        for date, value in self.__series.points():
+            yield StatisticValue(datetime=date, value=value)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
 @dataclass
 class WemStatistic():
     """Manage statistics with values"""
@@ -45,31 +74,65 @@ class WemStatistic():
     max_date: datetime
     min_date: datetime
     unit: str
-    values: List[StatisticValue]
+    series: StatisticSeries
+
+    def __init__(self, statistics_type: StatisticType, graph_type: GraphType, has_data: bool,
+                 max_date: datetime, min_date: datetime, unit: str,
+                 series: Optional[StatisticSeries] = None, values: Optional[Iterable[StatisticValue]] = None):
+        # pylint: disable=too-many-arguments
+        # values is still accepted in place of series, as StatisticValue objects
+        self.statistics_type = statistics_type
+        self.graph_type = graph_type
+        self.has_data = has_data
+        self.max_date = max_date
+        self.min_date = min_date
+        self.unit = unit
+        self.series = series if series is not None else StatisticSeries.from_points(
+            (value.datetime, value.value) for value in values or ()
+        )
 
+    @property
+    def values(self) -> StatisticValues:
+        """Values as StatisticValue objects"""
+        return StatisticValues(self.series)
 
-@dataclass
+    @values.setter
+    def values(self, values: Iterable[StatisticValue]):
+        self.series = StatisticSeries.from_points((value.datetime, value.value) for value in values)
+
+    def merge(self, other: "WemStatistic"):
+        """Merge values of another window, values of other win for equal dates"""
+        if not other.has_data:
+            return
+        self.series = self.series.merge(other.series)
+        self.has_data = True
+        self.max_date = max(self.max_date, other.max_date)
+        self.min_date = min(self.min_date, other.min_date)
+        self.unit = other.unit
+
+
+@dataclass(init=False)
 class WemHeatingStatistic(WemStatistic):
     """Manage statistics with values for heating system"""
     statistics_type = StatisticType.heating
 
 
-@dataclass
+@dataclass(init=False)
 class WemHotWaterStatistic(WemStatistic):
     """Manage statistics with values for hot water system"""
     statistics_type = StatisticType.hot_water
 
-@dataclass
+@dataclass(init=False)
 class WemSummaryStatistic(WemStatistic):
     """Manage statistics with summary values for the system"""
     statistics_type = StatisticType.summary
 
-@dataclass
+@dataclass(init=False)
 class WemDefrostStatistic(WemStatistic):
     """Manage statistics with defrost values for the system"""
     statistics_type = StatisticType.defrost
 
-@dataclass
+@dataclass(init=False)
 class WemCoolingStatistic(WemStatistic):
     """Manage statistics with values for the cooling system"""
     statistics_type = StatisticType.cooling
@@ -81,11 +144,16 @@ class StatisticValueParser:
     def load(value: Dict) -> StatisticValue:
         """load object from dict"""
         return StatisticValue(
-            datetime= parser.parse(value["Date"]),
+            datetime= parse_date(value["Date"]),
             value = value["Value"]
         )
 
 
+def _load_series(data: List[Dict]) -> StatisticSeries:
+    """load series from list of dicts"""
+    return StatisticSeries.from_points((parse_date(value["Date"]), value["Value"]) for value in data)
+
+
 class WemHeatingStatisticParser:
     """Parser for statistics with values for heating system"""
     @staticmethod
@@ -95,10 +163,10 @@ class WemHeatingStatisticParser:
             statistics_type = StatisticType.heating,
             graph_type = graph_type,
             has_data = statistic["HasData"],
-            max_date = parser.parse(statistic["MaxDate"]),
-            min_date = parser.parse(statistic["MinDate"]),
+            max_date = parse_date(statistic["MaxDate"]),
+            min_date = parse_date(statistic["MinDate"]),
             unit = statistic["Unit"],
-            values = [StatisticValueParser.load(value) for value in statistic["Data"]]
+            series = _load_series(statistic["Data"])
         )
 
 
@@ -111,10 +179,10 @@ class WemHotWaterStatisticParser:
             statistics_type = StatisticType.hot_water,
             graph_type = graph_type,
             has_data = statistic["HasData"],
-            max_date = parser.parse(statistic["MaxDate"]),
-            min_date = parser.parse(statistic["MinDate"]),
+            max_date = parse_date(statistic["MaxDate"]),
+            min_date = parse_date(statistic["MinDate"]),
             unit = statistic["Unit"],
-            values = [StatisticValueParser.load(value) for value in statistic["Data"]]
+            series = _load_series(statistic["Data"])
         )
 
 class WemSummaryStatisticParser:
@@ -126,10 +194,10 @@ class WemSummaryStatisticParser:
             statistics_type = StatisticType.summary,
             graph_type = graph_type,
             has_data = statistic["HasData"],
-            max_date = parser.parse(statistic["MaxDate"]),
-            min_date = parser.parse(statistic["MinDate"]),
+            max_date = parse_date(statistic["MaxDate"]),
+            min_date = parse_date(statistic["MinDate"]),
             unit = statistic["Unit"],
-            values = [StatisticValueParser.load(value) for value in statistic["Data"]]
+            series = _load_series(statistic["Data"])
         )
 
 class WemDefrostStatisticParser:
@@ -141,10 +209,10 @@ class WemDefrostStatisticParser:
             statistics_type = StatisticType.defrost,
             graph_type = graph_type,
             has_data = statistic["HasData"],
-            max_date = parser.parse(statistic["MaxDate"]),
-            min_date = parser.parse(statistic["MinDate"]),
+            max_date = parse_date(statistic["MaxDate"]),
+            min_date = parse_date(statistic["MinDate"]),
             unit = statistic["Unit"],
-            values = [StatisticValueParser.load(value) for value in statistic["Data"]]
+            series = _load_series(statistic["Data"])
         )
 
 class WemCoolingStatisticParser:
@@ -156,8 +224,8 @@ class WemCoolingStatisticParser:
             statistics_type = StatisticType.cooling,
             graph_type = graph_type,
             has_data = statistic["HasData"],
-            max_date = parser.parse(statistic["MaxDate"]),
-            min_date = parser.parse(statistic["MinDate"]),
+            max_date = parse_date(statistic["MaxDate"]),
+            min_date = parse_date(statistic["MinDate"]),
             unit = statistic["Unit"],
-            values = [StatisticValueParser.load(value) for value in statistic["Data"]]
+            series = _load_series(statistic["Data"])
         )
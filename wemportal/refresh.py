@@ -0,0 +1,59 @@
+"""
+Decide which parameters the portal has to refresh from the device before reading them
+"""
+import datetime
+from enum import Enum
+from typing import Dict, Optional
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_parameter import WemParameter
+
+
+class RefreshMode(Enum):
+    """
+    blocking: refresh stale parameters, then read
+    non_blocking: read right away and refresh stale parameters in the background for the next read
+    read_only: never refresh, read the values the portal has
+    """
+    blocking = "blocking"
+    non_blocking = "non_blocking"
+    read_only = "read_only"
+
+
+class RefreshPolicy:
+    """
+    Refresh only parameters whose value is older than max_age seconds or unknown,
+    the portal timestamps values when it last got them from the device
+    """
+
+    def __init__(self, max_age: float = 60, mode: RefreshMode = RefreshMode.blocking,
+                 overrides: Optional[Dict[str, float]] = None):
+        self.max_age: float = max_age
+        self.mode: RefreshMode = RefreshMode(mode)
+        self.overrides: Dict[str, float] = overrides or {}
+
+    def is_stale(self, parameter: WemParameter, now: Optional[datetime.datetime] = None) -> bool:
+        """Check if a parameter has no value or its value is older than its max age"""
+        if parameter.value is None or parameter.value.time is None:
+            return True
+        max_age = self.overrides.get(parameter.parameter_id, self.max_age)
+        return ((now or datetime.datetime.now()) - parameter.value.time).total_seconds() >= max_age
+
+    def get_refresh_query(self, device: WemDevice, query: Dict,
+                          now: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        """Reduce a read query to its stale parameters, None if nothing needs a refresh"""
+        if self.mode == RefreshMode.read_only:
+            return None
+        now = now or datetime.datetime.now()
+        modules = []
+        for module in query["Modules"]:
+            parameters = [
+                parameter for parameter in module["Parameters"]
+                if self.__is_stale(device, module, parameter["ParameterID"], now)
+            ]
+            if parameters:
+                modules.append({**module, "Parameters": parameters})
+        return {**query, "Modules": modules} if modules else None
+
+    def __is_stale(self, device: WemDevice, module: Dict, parameter_id: str, now: datetime.datetime) -> bool:
+        parameter = device.get_parameter(module["ModuleIndex"], module["ModuleType"], parameter_id)
+        return parameter is None or self.is_stale(parameter, now)
@@ -0,0 +1,238 @@
+"""
+Timeouts, retries, circuit breaking and adaptive concurrency for portal requests
+"""
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
+import requests
+from requests import Response, Session
+from wemportal.constants import LOGGER
+from wemportal.exceptions import CircuitOpenError, WemPortalConnectionError
+from wemportal.metrics import Instrumentation
+
+Timeout = Union[float, Tuple[float, float]]
+
+# Connect and read timeout per endpoint, the portal refreshes values and builds statistics slowly
+default_timeouts: Dict[str, Timeout] = {
+    "/app/DataAccess/Refresh": (5.0, 60.0),
+    "/Web/Api/DeviceStatistics/GetStatistics": (5.0, 60.0),
+}
+
+# Errors worth another attempt, anything else is a bug or a permanent failure
+_transient_errors = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff, only applied to idempotent requests"""
+    attempts: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 10.0
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    def delay(self, attempt: int, response: Optional[Response] = None) -> float:
+        """Seconds to wait before the next attempt, honouring a numeric Retry-After header"""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.max_backoff))
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails fast until reset_timeout elapsed,
+    then lets a single trial request through to decide whether to close again
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.__failures: int = 0
+        self.__opened: Optional[float] = None
+        self.__trial: bool = False
+        self.__lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """closed, open or half_open"""
+        with self.__lock:
+            if self.__opened is None:
+                return "closed"
+            if self.__trial or time.monotonic() - self.__opened >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        """Check if a request may be sent"""
+        with self.__lock:
+            if self.__opened is None:
+                return True
+            if self.__trial or time.monotonic() - self.__opened < self.reset_timeout:
+                return False
+            self.__trial = True
+            return True
+
+    def record_success(self):
+        """Close the circuit"""
+        with self.__lock:
+            self.__failures = 0
+            self.__opened = None
+            self.__trial = False
+
+    def record_failure(self):
+        """Count a failure, a failed trial opens the circuit again"""
+        with self.__lock:
+            self.__failures += 1
+            if self.__trial or self.__failures >= self.failure_threshold:
+                if self.__opened is None:
+                    LOGGER.warning("Portal failing, pausing requests for %ss", self.reset_timeout)
+                self.__opened = time.monotonic()
+                self.__trial = False
+
+
+class AdaptiveLimit:
+    """
+    Blocking concurrency limit, grows by one request per round trip while the portal is healthy
+    and halves on errors or responses slower than latency_threshold
+    """
+
+    def __init__(self, max_limit: int = 8, min_limit: int = 1, latency_threshold: float = 5.0):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("limits must satisfy 1 <= min_limit <= max_limit")
+        self.max_limit: int = max_limit
+        self.min_limit: int = min_limit
+        self.latency_threshold: float = latency_threshold
+        self.limit: float = max_limit
+        self.__in_flight: int = 0
+        self.__decreased: float = 0.0
+        self.__condition = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests currently sent"""
+        return self.__in_flight
+
+    def acquire(self) -> float:
+        """Wait for a free slot, returns the start time to pass to release()"""
+        with self.__condition:
+            while self.__in_flight >= int(self.limit):
+                self.__condition.wait()
+            self.__in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, failed: bool = False):
+        """Free the slot and adapt the limit to the outcome of the request"""
+        with self.__condition:
+            self.__in_flight -= 1
+            now = time.monotonic()
+            if failed or now - started > self.latency_threshold:
+                # Requests sent before the last decrease saw the same congestion, only decrease once for them
+                if started > self.__decreased:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.__decreased = now
+                    LOGGER.debug("Portal congested, lowering concurrency to %s", int(self.limit))
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.__condition.notify_all()
+
+
+class ResiliencePolicy:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Send portal requests with timeouts, retries of idempotent requests, a circuit breaker per endpoint
+    and an optional adaptive concurrency limit. Share a policy between clients to share breakers and limit.
+    """
+
+    def __init__(self, timeout: Timeout = (5.0, 30.0),
+                 timeouts: Optional[Dict[str, Timeout]] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0,
+                 limit: Optional[AdaptiveLimit] = None):
+        # pylint: disable=too-many-arguments
+        self.timeout: Timeout = timeout
+        self.timeouts: Dict[str, Timeout] = default_timeouts if timeouts is None else timeouts
+        self.retry: RetryPolicy = retry or RetryPolicy()
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.limit: Optional[AdaptiveLimit] = limit
+        self.__breakers: Dict[str, CircuitBreaker] = {}
+        self.__lock = threading.Lock()
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        """Circuit breaker of an endpoint"""
+        with self.__lock:
+            breaker = self.__breakers.get(endpoint)
+            if breaker is None:
+                breaker = self.__breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def timeout_for(self, endpoint: str) -> Timeout:
+        """Timeout of an endpoint"""
+        return self.timeouts.get(endpoint, self.timeout)
+
+    def send(self, session: Session, method: str, base_url: str, path: str,
+             idempotent: Optional[bool] = None, instrumentation: Optional[Instrumentation] = None,
+             **kwargs) -> Response:
+        """
+        Send a request, GET requests are retried unless idempotent is False.
+        Raises CircuitOpenError without sending while the endpoint is failing
+        and WemPortalConnectionError if the portal still answers with a server error.
+        Every attempt is reported to instrumentation.
+        """
+        # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
+        endpoint = path.split("?", 1)[0]
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD", "OPTIONS")
+        attempts = max(self.retry.attempts, 1) if idempotent else 1
+        breaker = self.breaker(endpoint)
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        url = f"{base_url}{path}"
+        throttle = getattr(session.get_adapter(url), "throttle", None)
+
+        for attempt in range(attempts):
+            if not breaker.allow():
+                if instrumentation is not None:
+                    instrumentation.request(method, endpoint, None, 0, 0.0, attempt, CircuitOpenError.__name__)
+                raise CircuitOpenError(f"Portal endpoint {endpoint} is failing, retry in {self.reset_timeout}s")
+            if throttle is not None:
+                # Rate limit waits are taken before the slot, so they are neither latency nor overload
+                throttle()
+            started = self.limit.acquire() if self.limit else 0.0
+            response: Optional[Response] = None
+            error: Optional[Exception] = None
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except _transient_errors as exception:
+                error = exception
+            finally:
+                if instrumentation is not None and instrumentation.enabled:
+                    instrumentation.request(
+                        method, endpoint, None if response is None else response.status_code,
+                        0 if response is None else len(response.content), time.perf_counter() - start,
+                        attempt, None if error is None else type(error).__name__,
+                    )
+                failed = response is None or response.status_code in self.retry.retry_statuses
+                if self.limit:
+                    self.limit.release(started, failed)
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+
+            if not failed or attempt + 1 == attempts:
+                break
+            delay = self.retry.delay(attempt, response)
+            LOGGER.debug("Request to %s failed (%s), retrying in %.2fs",
+                         endpoint, error or response.status_code, delay)
+            time.sleep(delay)
+
+        if error is not None:
+            raise error
+        if failed:
+            raise WemPortalConnectionError(f"Portal endpoint {endpoint} failed with status {response.status_code}")
+        return response
@@ -0,0 +1,112 @@
+"""
+Derive monthly and yearly statistics from daily statistics instead of requesting them from the portal
+"""
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_series import StatisticSeries, from_timestamp
+from wemportal.model.wem_statistic import GraphType, StatisticType, WemStatistic
+
+# Resample period of the graph types a daily statistic rolls up to
+_periods = {GraphType.monthly: "month", GraphType.yearly: "year"}
+
+
+def rollup(statistic: WemStatistic, graph_type: GraphType, how: str = "sum") -> WemStatistic:
+    """Monthly or yearly statistic of a daily statistic"""
+    return _statistic(statistic, graph_type, statistic.series.resample(_periods[graph_type], how))
+
+
+def _statistic(daily: WemStatistic, graph_type: GraphType, series: StatisticSeries) -> WemStatistic:
+    return type(daily)(
+        statistics_type=daily.statistics_type,
+        graph_type=graph_type,
+        has_data=bool(len(series)),
+        max_date=series.datetime(-1) if len(series) else daily.max_date,
+        min_date=series.datetime(0) if len(series) else daily.min_date,
+        unit=daily.unit,
+        series=series,
+    )
+
+
+@dataclass
+class _Rollups:
+    """Daily values rolled up so far and their monthly and yearly series"""
+    daily: StatisticSeries
+    monthly: StatisticSeries
+    yearly: StatisticSeries
+
+
+class StatisticRollup:
+    """
+    Keep monthly and yearly rollups of the daily statistics of devices up to date.
+    Each update only aggregates the days of the months and years from the last rolled up day on,
+    the last day may still grow. Both are aggregated from the days, so any how is exact.
+    Days before the last rolled up day are final: a revised value of such a day is kept in the daily
+    statistic, but its month and year are not aggregated again.
+
+    Usage::
+
+        rollup = StatisticRollup()
+        devices = api.fetch_devices(incremental_statistics=True)
+        rollup.update_devices(devices)
+        rollup.get(devices[0], StatisticType.heating, GraphType.monthly)
+    """
+
+    def __init__(self, how: str = "sum"):
+        self.how: str = how
+        self.__rollups: Dict[Tuple[int, StatisticType], _Rollups] = {}
+        self.__statistics: Dict[Tuple[int, StatisticType, GraphType], WemStatistic] = {}
+        self.__lock = threading.Lock()
+
+    def update(self, device: WemDevice, statistic: WemStatistic):
+        """Roll up new days of a daily statistic of a device"""
+        if statistic.graph_type != GraphType.daily or not statistic.series:
+            return
+        series = statistic.series
+        key = (device.id, statistic.statistics_type)
+        with self.__lock:
+            rollups = self.__rollups.get(key)
+            if rollups is None:
+                # A copy, the statistic may still change
+                daily = StatisticSeries(series.timestamps, series.values, series.tzinfo)
+                rollups = _Rollups(daily, daily.resample("month", self.how), daily.resample("year", self.how))
+            else:
+                # Periods before the last rolled up day are final, unless the series starts later
+                daily = rollups.daily.merge(series)
+                month = _month_start(from_timestamp(max(rollups.daily.timestamps[-1], series.timestamps[0]),
+                                                    daily.tzinfo))
+                year = month.replace(month=1)
+                rollups = _Rollups(
+                    daily,
+                    rollups.monthly.merge(daily.between(start=month).resample("month", self.how)),
+                    rollups.yearly.merge(daily.between(start=year).resample("year", self.how)),
+                )
+            self.__rollups[key] = rollups
+            self.__statistics[key + (GraphType.daily,)] = _statistic(statistic, GraphType.daily, rollups.daily)
+            self.__statistics[key + (GraphType.monthly,)] = _statistic(statistic, GraphType.monthly, rollups.monthly)
+            self.__statistics[key + (GraphType.yearly,)] = _statistic(statistic, GraphType.yearly, rollups.yearly)
+
+    def update_devices(self, devices: Iterable[WemDevice]):
+        """Roll up the daily statistics held by devices"""
+        for device in devices:
+            for statistic in device.statistics:
+                self.update(device, statistic)
+
+    def get(self, device: WemDevice, statistics_type: StatisticType,
+            graph_type: GraphType = GraphType.monthly) -> Optional[WemStatistic]:
+        """Daily statistic of all rolled up days, or the monthly or yearly statistic, None before the first update"""
+        with self.__lock:
+            return self.__statistics.get((device.id, statistics_type, graph_type))
+
+    def forget(self, device_id: Optional[int] = None):
+        """Drop the rollups of a device or of all devices"""
+        with self.__lock:
+            for rollups in (self.__rollups, self.__statistics):
+                for key in [key for key in rollups if device_id is None or key[0] == device_id]:
+                    del rollups[key]
+
+
+def _month_start(date: datetime) -> datetime:
+    return date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
@@ -0,0 +1,72 @@
+"""
+Schedule parameter polling with individual refresh intervals
+"""
+import time
+from typing import Dict, Optional, Tuple
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_module import WemModule
+from wemportal.model.wem_parameter import DataType, WemParameter
+
+
+class PollScheduler:
+    """
+    Decide which parameters are due for polling
+
+    Interval of a parameter, first match wins:
+    explicit override by parameter id, dynamic values, writeable setpoints, interval of the data type.
+    """
+
+    def __init__(self,
+                 dynamic_interval: float = 60,
+                 setpoint_interval: float = 60 * 60,
+                 data_type_intervals: Optional[Dict[DataType, float]] = None,
+                 overrides: Optional[Dict[str, float]] = None):
+        self.dynamic_interval: float = dynamic_interval
+        self.setpoint_interval: float = setpoint_interval
+        self.data_type_intervals: Dict[DataType, float] = {
+            DataType.value: 5 * 60,
+            DataType.decimal_value: 5 * 60,
+            DataType.function: 60 * 60,
+            DataType.time: 60 * 60,
+            DataType.program: 60 * 60,
+        }
+        self.data_type_intervals.update(data_type_intervals or {})
+        self.overrides: Dict[str, float] = overrides or {}
+        self.__last_polled: Dict[Tuple[int, int, int, str], float] = {}
+
+    def interval(self, parameter: WemParameter) -> float:
+        """Refresh interval of a parameter in seconds"""
+        if parameter.parameter_id in self.overrides:
+            return self.overrides[parameter.parameter_id]
+        if parameter.value is not None and parameter.value.dynamisation:
+            return self.dynamic_interval
+        if parameter.is_writeable:
+            return self.setpoint_interval
+        return self.data_type_intervals.get(parameter.data_type, self.setpoint_interval)
+
+    def is_due(self, device: WemDevice, module: WemModule, parameter: WemParameter,
+               now: Optional[float] = None) -> bool:
+        """Check if a parameter was never polled or its interval elapsed"""
+        # pylint: disable=too-many-arguments
+        last_polled = self.__last_polled.get((device.id, module.index, int(module.type), parameter.parameter_id))
+        if last_polled is None:
+            return True
+        return (now or time.time()) - last_polled >= self.interval(parameter)
+
+    def get_parameter_query(self, device: WemDevice, now: Optional[float] = None) -> Optional[Dict]:
+        """Build query for all due parameters of a device, None if nothing is due"""
+        now = now or time.time()
+        data = device.get_parameter_query(lambda module, parameter: self.is_due(device, module, parameter, now))
+        return data if data["Modules"] else None
+
+    def mark_polled(self, query: Dict, now: Optional[float] = None):
+        """Record the parameters of a query as polled"""
+        now = now or time.time()
+        for module in query["Modules"]:
+            for parameter in module["Parameters"]:
+                key = (query["DeviceID"], module["ModuleIndex"], module["ModuleType"], parameter["ParameterID"])
+                self.__last_polled[key] = now
+
+    def reset(self):
+        """Forget poll times, every parameter is due on the next tick"""
+        self.__last_polled.clear()
@@ -0,0 +1,104 @@
+"""
+Storage for portal sessions to reuse logins across processes
+"""
+import threading
+import time
+from typing import Dict, Optional
+from requests import Session
+from requests.cookies import create_cookie
+from wemportal.cache import _dump_json, _load_json
+
+
+class SessionStore:
+    """
+    Base class for session storage, subclasses implement the backend
+    """
+
+    def __init__(self, ttl: float = 60 * 60):
+        self.ttl: float = ttl
+
+    def _read(self, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def _write(self, key: str, entry: Dict):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Forget a stored session"""
+        raise NotImplementedError
+
+    def save(self, key: str, session: Session):
+        """Serialize the cookie jar of a session"""
+        cookies = [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "secure": cookie.secure,
+                "expires": cookie.expires,
+            }
+            for cookie in session.cookies
+        ]
+        self._write(key, {"expires": time.time() + self.ttl, "cookies": cookies})
+
+    def restore(self, key: str, session: Session) -> bool:
+        """Load stored cookies into session, return False if there is no unexpired session"""
+        entry = self._read(key)
+        if not entry or not entry["cookies"] or entry["expires"] < time.time():
+            return False
+
+        session.cookies.clear()
+        for cookie in entry["cookies"]:
+            session.cookies.set_cookie(create_cookie(**cookie))
+        return True
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Keep sessions in memory, e.g. to share them between client instances
+    """
+
+    def __init__(self, ttl: float = 60 * 60):
+        super().__init__(ttl)
+        self.__lock = threading.Lock()
+        self.__entries: Dict[str, Dict] = {}
+
+    def _read(self, key: str) -> Optional[Dict]:
+        with self.__lock:
+            return self.__entries.get(key)
+
+    def _write(self, key: str, entry: Dict):
+        with self.__lock:
+            self.__entries[key] = entry
+
+    def delete(self, key: str):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+
+class FileSessionStore(SessionStore):
+    """
+    Keep sessions in a json file readable only by the owner
+    """
+
+    def __init__(self, path: str, ttl: float = 60 * 60):
+        super().__init__(ttl)
+        self.path: str = path
+        self.__lock = threading.Lock()
+
+    def _read(self, key: str) -> Optional[Dict]:
+        with self.__lock:
+            return _load_json(self.path).get(key)
+
+    def _write(self, key: str, entry: Dict):
+        with self.__lock:
+            entries = _load_json(self.path)
+            entries[key] = entry
+            _dump_json(self.path, entries, private=True)
+
+    def delete(self, key: str):
+        with self.__lock:
+            entries = _load_json(self.path)
+            if entries.pop(key, None) is not None:
+                _dump_json(self.path, entries, private=True)
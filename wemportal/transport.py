@@ -0,0 +1,112 @@
+"""
+Connection pooling shared by all sessions of the api and web clients
+"""
+import threading
+import time
+from typing import List, Sequence, Tuple
+import requests
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+
+default_pool_size = 10
+
+
+class RateLimiter:
+    # pylint: disable=too-few-public-methods
+    """
+    Thread safe token bucket, acquire() blocks until a request may be sent
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate: float = rate
+        self.burst: int = max(burst, 1)
+        self.__tokens: float = self.burst
+        self.__updated: float = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting for it if the bucket is empty"""
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            # Reserve the token, a negative balance queues later callers behind this one
+            self.__tokens -= 1
+            wait = -self.__tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class SharedPoolAdapter(HTTPAdapter):
+    """
+    Transport adapter using a connection pool shared by many sessions and applying rate limits
+    """
+
+    def __init__(self, pool_manager: PoolManager, limiters: Sequence[RateLimiter] = ()):
+        self.__pool_manager = pool_manager
+        self.limiters: Tuple[RateLimiter, ...] = tuple(limiters)
+        self.__throttled = threading.local()
+        super().__init__()
+
+    def init_poolmanager(self, *args, **kwargs):  # pylint: disable=unused-argument
+        self.poolmanager = self.__pool_manager
+
+    def throttle(self):
+        """Wait for the rate limits now, the next request of this thread is sent without waiting again"""
+        for limiter in self.limiters:
+            limiter.acquire()
+        self.__throttled.pending = True
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=arguments-differ
+        if not getattr(self.__throttled, "pending", False):
+            for limiter in self.limiters:
+                limiter.acquire()
+        self.__throttled.pending = False
+        return super().send(request, *args, **kwargs)
+
+    def close(self):
+        # The shared pool outlives single sessions, Transport.close() clears it
+        pass
+
+
+class Transport:
+    """
+    Hand out sessions sharing one keep-alive connection pool, so api and web clients and new logins
+    reuse warm connections instead of opening new TLS connections.
+    Each session keeps its own cookies and headers.
+    """
+
+    def __init__(self, pool_size: int = default_pool_size):
+        self.pool_size: int = pool_size
+        self.__pool_managers: List[PoolManager] = [PoolManager(num_pools=4, maxsize=pool_size)]
+        self.__lock = threading.Lock()
+
+    def session(self, limiters: Sequence[RateLimiter] = ()) -> Session:
+        """New session using the shared pool, requests are rate limited by limiters"""
+        session = requests.Session()
+        with self.__lock:
+            adapter = SharedPoolAdapter(self.__pool_managers[-1], limiters)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def resize(self, pool_size: int):
+        """
+        Keep up to pool_size connections per host for sessions created from now on, the pool only grows.
+        Existing sessions keep their pool and its open connections.
+        """
+        with self.__lock:
+            if pool_size <= self.pool_size:
+                return
+            self.pool_size = pool_size
+            # Pools are created with their size, a larger pool needs a new pool manager
+            self.__pool_managers.append(PoolManager(num_pools=4, maxsize=pool_size))
+
+    def close(self):
+        """Close all pooled connections"""
+        with self.__lock:
+            for pool_manager in self.__pool_managers:
+                pool_manager.clear()
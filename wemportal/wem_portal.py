@@ -1,8 +1,20 @@
 """
 Abstraction for API and WEB classes
 """
-from wemportal import WemPortalAPI
-from wemportal.wem_portal_web import WemPortalWeb
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from wemportal.cache import ParameterCache, StructureCache
+from wemportal.changes import ChangeDetector
+from wemportal.metrics import Instrumentation
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_parameter import WemParameter
+from wemportal.model.wem_statistic import GraphType, StatisticType
+from wemportal.resilience import ResiliencePolicy
+from wemportal.refresh import RefreshPolicy
+from wemportal.scheduler import PollScheduler
+from wemportal.session_store import SessionStore
+from wemportal.transport import Transport
+from wemportal.wem_portal_api import WemPortalAPI
+from wemportal.wem_portal_web import LazyStatisticLoader, WemPortalWeb
 
 
 class WemPortal:
@@ -10,28 +22,88 @@ class WemPortal:
     Class to interact with wemportal via api and web
     """
 
-    def __init__(self, username: str, password: str):
+    def __init__(self, username: str, password: str,
+                 structure_cache: Optional[StructureCache] = None,
+                 parameter_cache: Optional[ParameterCache] = None,
+                 session_store: Optional[SessionStore] = None,
+                 scheduler: Optional[PollScheduler] = None,
+                 base_url: Optional[str] = None,
+                 resilience: Optional[ResiliencePolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 compact_models: bool = False,
+                 refresh_policy: Optional[RefreshPolicy] = None,
+                 change_detector: Optional[ChangeDetector] = None,
+                 transport: Optional[Transport] = None):
+        # pylint: disable=too-many-arguments
         self.username: str = username
         self.password: str = password
-        self.__api: WemPortalAPI = WemPortalAPI(username=username, password=password)
-        self.__web: WemPortalWeb = WemPortalWeb(username=username, password=password)
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
+        resilience = resilience or ResiliencePolicy()
+        # Api and web sessions share keep-alive connections
+        transport = transport or Transport()
+        self.__api: WemPortalAPI = WemPortalAPI(
+            username=username, password=password, parameter_cache=parameter_cache,
+            session_store=session_store, scheduler=scheduler, base_url=base_url, resilience=resilience,
+            instrumentation=self.instrumentation, compact_models=compact_models, refresh_policy=refresh_policy,
+            change_detector=change_detector, transport=transport
+        )
+        self.__web: WemPortalWeb = WemPortalWeb(
+            username=username, password=password, structure_cache=structure_cache,
+            session_store=session_store, base_url=base_url, resilience=resilience,
+            instrumentation=self.instrumentation, transport=transport
+        )
+        # Lazy statistic loaders by graph type, they keep their load times across polls
+        self.__loaders: Dict[GraphType, LazyStatisticLoader] = {}
 
     def login(self):
-        """Login to api and web"""
+        """Login to api, the web login follows with the first statistics request"""
         self.__api.login()
-        self.__web.login()
 
-    def fetch_devices(self):
-        """Fetch data"""
-        devices = self.__api.fetch()
+    def fetch_devices(self,
+                      incremental_statistics: bool = False,
+                      statistics_types: Optional[Iterable[StatisticType]] = None,
+                      graph_type: GraphType = GraphType.daily,
+                      lazy_statistics: bool = False,
+                      statistics_ttl: float = 60 * 60):
+        """
+        Fetch data and the given statistic types, all by default and none for an empty list.
+        With incremental_statistics only statistic values newer than the held ones are requested.
+        With lazy_statistics statistics are fetched on first attribute access and again after statistics_ttl.
+        """
+        # pylint: disable=too-many-arguments
+        with self.instrumentation.run("fetch_devices") as run:
+            devices = self.__api.fetch()
+            run.extend(devices)
+            self.__fetch_statistics(devices, incremental_statistics, statistics_types, graph_type,
+                                    lazy_statistics, statistics_ttl)
+        return devices
+
+    def __fetch_statistics(self, devices: List[WemDevice], incremental_statistics: bool,
+                           statistics_types: Optional[Iterable[StatisticType]], graph_type: GraphType,
+                           lazy_statistics: bool, statistics_ttl: float):
+        # pylint: disable=too-many-arguments
+        if lazy_statistics:
+            loader = self.__loaders.get(graph_type)
+            if loader is None:
+                loader = self.__loaders[graph_type] = LazyStatisticLoader(self.__web, graph_type=graph_type)
+            loader.ttl = statistics_ttl
+            for device in devices:
+                device.statistic_loader = loader
+            return
+
+        statistics_types = tuple(StatisticType) if statistics_types is None else tuple(statistics_types)
         for device in devices:
-            self.__web.get_heating_statistic(device)
-            self.__web.get_hot_water_statistic(device)
-            self.__web.get_summary_statistic(device)
-            self.__web.get_defrost_statistic(device)
-            self.__web.get_cooling_statistic(device)
+            device.statistic_loader = None
+            for statistics_type in statistics_types:
+                if incremental_statistics:
+                    self.__web.sync_statistic(device, statistics_type, graph_type)
+                else:
+                    self.__web.get_statistic(device, statistics_type, graph_type)
 
-        return devices
+    def write_values(self, device: WemDevice, values: Dict[Tuple[int, int, str], Union[float, str]],
+                     confirm: bool = True) -> List[WemParameter]:
+        """Write values keyed by module index, module type and parameter id, see WemPortalAPI.write_values"""
+        return self.__api.write_values(device, values, confirm)
 
     def logout(self):
         """Logout from api and web"""
@@ -2,35 +2,96 @@
 Interact with wemportal via api
 """
 import json
-from typing import Dict, List, Optional
-import requests
-from requests import Session
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple, Union
+from requests import Response, Session
+from wemportal.cache import ParameterCache
+from wemportal.changes import ChangeDetector
 from wemportal.constants import LOGGER, wem_url
-from wemportal.exceptions import WemPortalConnectionError
+from wemportal.exceptions import WemPortalConnectionError, WemPortalError
+from wemportal.metrics import Instrumentation
 from wemportal.model.wem_device import WemDevice, WemDeviceParser
-from wemportal.model.wem_parameter import WemParameterParser
+from wemportal.model.wem_module import WemModule
+from wemportal.model.wem_parameter import WemParameter, WemParameterParser
 from wemportal.model.wem_value import WemValueParser
+from wemportal.refresh import RefreshMode, RefreshPolicy
+from wemportal.resilience import ResiliencePolicy
+from wemportal.scheduler import PollScheduler
+from wemportal.session_store import SessionStore
+from wemportal.transport import Transport
+
+_json_headers = {"Content-Type": "application/json"}
+# The device may echo written values rounded, e.g. 21.499999 for 21.5
+_write_tolerance = 1e-4
 
 
 class WemPortalAPI:
+    # pylint: disable=too-many-instance-attributes
     """
     Class to interact with wemportal via api
     """
 
-    def __init__(self, username: str, password: str):
+    def __init__(self, username: str, password: str,
+                 parameter_cache: Optional[ParameterCache] = None,
+                 session_store: Optional[SessionStore] = None,
+                 scheduler: Optional[PollScheduler] = None,
+                 base_url: Optional[str] = None,
+                 session: Optional[Session] = None,
+                 resilience: Optional[ResiliencePolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 compact_models: bool = False,
+                 refresh_policy: Optional[RefreshPolicy] = None,
+                 change_detector: Optional[ChangeDetector] = None,
+                 transport: Optional[Transport] = None):
+        # pylint: disable=too-many-arguments
+        self.base_url: str = base_url or wem_url
         self.devices: List[WemDevice] = []
         self.headers: Dict = {
             "User-Agent": "WeishauptWEMApp",
             "X-Api-Version": "2.0.0.0",
             "Accept": "*/*",
         }
-        self.session: Optional[Session] = None
+        self.session: Optional[Session] = session
+        self.transport: Transport = transport or Transport()
         self.username: str = username
         self.password: str = password
+        self.parameter_cache: ParameterCache = parameter_cache or ParameterCache()
+        self.session_store: Optional[SessionStore] = session_store
+        self.scheduler: Optional[PollScheduler] = scheduler
+        self.refresh_policy: Optional[RefreshPolicy] = refresh_policy
+        self.change_detector: Optional[ChangeDetector] = change_detector
+        self.resilience: ResiliencePolicy = resilience or ResiliencePolicy()
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
+        self.__device_parser = WemDeviceParser
+        self.__parameter_parser = WemParameterParser
+        self.__value_parser = WemValueParser
+        if compact_models:
+            # Slotted models with shared enum values, names and units for large fleets, imported on demand
+            from wemportal.model import wem_compact  # pylint: disable=import-outside-toplevel
+            self.__device_parser = wem_compact.CompactWemDeviceParser
+            self.__parameter_parser = wem_compact.CompactWemParameterParser
+            self.__value_parser = wem_compact.CompactWemValueParser
+        self.__session_key: str = f"api:{username}"
+        self.__login_lock = threading.Lock()
+        self.__login_count: int = 0
+        self.__refresh_executor: Optional[ThreadPoolExecutor] = None
+        self.__pending_refreshes: Set[int] = set()
+        self.__refresh_lock = threading.Lock()
+        # Serialized full parameter query per device id and the parameter lists it was built from
+        self.__queries: Dict[int, Tuple[List, Dict, str]] = {}
+
+    def login(self, force: bool = False):
+        """Login to api, a stored session is reused unless force is set"""
+        if self.session is None:
+            self.session = self.transport.session()
+        self.session.headers.update(self.headers)
+        if not force and self.session_store and self.session_store.restore(self.__session_key, self.session):
+            LOGGER.debug("Reusing stored api session")
+            self.__login_count += 1
+            return
 
-    def login(self):
-        """Login to api"""
-        self.session = requests.Session()
         self.session.cookies.clear()
         payload = {
             "Name": self.username,
@@ -39,21 +100,44 @@ class WemPortalAPI:
             "AppVersion": "2.0.2",
             "ClientOS": "Android",
         }
-        self.session.headers.update(self.headers)
-        response = self.session.post(
-            f"{wem_url}/app/Account/Login",
-            data=payload,
-        )
+        response = self.resilience.send(self.session, "POST", self.base_url, "/app/Account/Login",
+                                        instrumentation=self.instrumentation, data=payload)
         if response.status_code != 200:
             raise WemPortalConnectionError(
                 f"Authentication Error: "
                 f"Check if your login credentials are correct. "
                 f"Receive response code: {response.status_code}, response: {response.content}"
             )
+        if self.session_store:
+            self.session_store.save(self.__session_key, self.session)
+        self.__login_count += 1
+
+    def _request(self, method: str, path: str, idempotent: Optional[bool] = None, **kwargs) -> Response:
+        """
+        Send request to api, login again once if the portal rejects the session.
+        Idempotent requests, GET by default, are retried on connection errors and server errors.
+        """
+        login_count = self.__login_count
+        response = self.resilience.send(self.session, method, self.base_url, path, idempotent,
+                                        self.instrumentation, **kwargs)
+        if response.status_code in (401, 403):
+            with self.__login_lock:
+                # Concurrent requests share a single new login
+                if login_count == self.__login_count:
+                    LOGGER.debug("Api session rejected, login again")
+                    self.login(force=True)
+            response = self.resilience.send(self.session, method, self.base_url, path, idempotent,
+                                            self.instrumentation, **kwargs)
+        return response
+
+    @property
+    def logged_in(self) -> bool:
+        """Check if login was called"""
+        return self.__login_count > 0
 
     def fetch(self):
         """Get data from the mobile API"""
-        if self.session is None:
+        if not self.logged_in:
             self.login()
 
         if not self.devices:
@@ -65,63 +149,192 @@ class WemPortalAPI:
 
     def get_devices(self):
         """Fetching api device data"""
+        self.devices = self.read_devices()
+        for device in self.devices:
+            self.parameter_cache.prune(device)
+            for module in device.modules:
+                self.get_module_parameters(device, module)
+        self.parameter_cache.save()
+
+    def read_devices(self) -> List[WemDevice]:
+        """Read devices and their modules without parameters"""
         LOGGER.debug("Fetching api device data")
-        response = self.session.get(
-            f"{wem_url}/app/Device/Read"
-        )
-        data = response.json()
-        self.devices = []
-        for device in data["Devices"]:
-            device_object = WemDeviceParser.load(device)
-            for module in device_object.modules:
-                LOGGER.debug("Fetching api parameters data")
+        response = self._request("GET", "/app/Device/Read")
+        devices = response.json()["Devices"]
+        with self.instrumentation.parse("WemDeviceParser", len(devices)):
+            return [self.__device_parser.load(device) for device in devices]
 
+    def get_module_parameters(self, device: WemDevice, module: WemModule):
+        """Fetch parameter definitions of a single module, unless cached for its firmware version"""
+        with self.instrumentation.device(device.id):
+            parameters = self.parameter_cache.get(device.id, module)
+            if parameters is None:
+                LOGGER.debug("Fetching api parameters data")
                 data = {
-                    "DeviceID": device_object.id,
+                    "DeviceID": device.id,
                     "ModuleIndex": module.index,
                     "ModuleType": int(module.type)
                 }
-                response = self.session.post(
-                    f"{wem_url}/app/EventType/Read",
-                    data=data,
-                )
-                module.parameters = [WemParameterParser.load(param) for param in response.json()["Parameters"]]
+                response = self._request("POST", "/app/EventType/Read", idempotent=True, data=data)
+                parameters = response.json()["Parameters"]
+                self.parameter_cache.set(device.id, module, parameters)
 
-            self.devices.append(device_object)
+            with self.instrumentation.parse("WemParameterParser", len(parameters)):
+                module.parameters = [self.__parameter_parser.load(param) for param in parameters]
 
     def get_values(self):
-        """Refresh and retrieve new values"""
+        """
+        Refresh and retrieve new values, only of due parameters if a scheduler is set
+        and only refreshing stale parameters if a refresh policy is set
+        """
         LOGGER.debug("Refreshing and retrieving new values")
 
         for device in self.devices:
-            data = device.get_parameter_query()
-            headers = {"Content-Type": "application/json"}
-
-            # Refresh
-            self.session.post(
-                f"{wem_url}/app/DataAccess/Refresh",
-                headers=headers,
-                data=json.dumps(data),
-            )
+            self.get_device_values(device)
+
+    def get_device_values(self, device: WemDevice):
+        """Refresh and retrieve new values of a single device"""
+        with self.instrumentation.device(device.id):
+            self.__get_device_values(device)
+
+    def __get_device_values(self, device: WemDevice):
+        if self.scheduler:
+            data = self.scheduler.get_parameter_query(device)
+            if data is None:
+                return
+            payload = json.dumps(data)
+        else:
+            data, payload = self.__parameter_query(device)
+
+        # Refresh
+        refresh = self.refresh_policy.get_refresh_query(device, data) if self.refresh_policy else data
+        if refresh is not None:
+            refresh_payload = payload if refresh is data else json.dumps(refresh)
+            if self.refresh_policy and self.refresh_policy.mode == RefreshMode.non_blocking:
+                self.__refresh_later(device, refresh_payload)
+            else:
+                self._request("POST", "/app/DataAccess/Refresh", idempotent=True,
+                              headers=_json_headers, data=refresh_payload)
+
+        # Read
+        self.__read_values(device, payload)
+
+        if self.scheduler:
+            self.scheduler.mark_polled(data)
+
+    def __parameter_query(self, device: WemDevice) -> Tuple[Dict, str]:
+        """Query for all parameters of a device and its json, serialized again only if the parameters changed"""
+        parameters = [(module.parameters, len(module.parameters)) for module in device.modules]
+        cached = self.__queries.get(device.id)
+        if (cached is not None and len(cached[0]) == len(parameters)
+                and all(held is current and held_length == length
+                        for (held, held_length), (current, length) in zip(cached[0], parameters))):
+            return cached[1], cached[2]
+        data = device.get_parameter_query()
+        payload = json.dumps(data)
+        self.__queries[device.id] = (parameters, data, payload)
+        return data, payload
+
+    def __read_values(self, device: WemDevice, payload: str):
+        values = self._request("POST", "/app/DataAccess/Read", idempotent=True,
+                               headers=_json_headers, data=payload).json()
+
+        with self.instrumentation.parse("WemValueParser", sum(len(module['Values']) for module in values['Modules'])):
+            self.__set_values(device, values)
+
+    def write_values(self, device: WemDevice, values: Dict[Tuple[int, int, str], Union[float, str]],
+                     confirm: bool = True) -> List[WemParameter]:
+        """
+        Write values keyed by module index, module type and parameter id with a single request.
+        All values are validated against the parameter definitions before anything is sent.
+        With confirm only the written parameters are refreshed and read back,
+        returns the written parameters whose value does not match yet.
+        """
+        data = device.get_write_query(values)
+        if not data["Modules"]:
+            return []
+
+        with self.instrumentation.device(device.id):
+            LOGGER.debug("Writing %s values of device %s", len(values), device.id)
+            # Not retried, the portal may have applied a write that timed out
+            response = self._request("POST", "/app/DataAccess/Write", headers=_json_headers, data=json.dumps(data))
+            if response.status_code != 200:
+                raise WemPortalError(f"Writing values of device {device.id} failed with status {response.status_code}")
+            if not confirm:
+                return []
+
+            query = {
+                "DeviceID": device.id,
+                "Modules": [{
+                    "ModuleIndex": module["ModuleIndex"],
+                    "ModuleType": module["ModuleType"],
+                    "Parameters": [{"ParameterID": parameter["ParameterID"]} for parameter in module["Parameters"]],
+                } for module in data["Modules"]],
+            }
+            payload = json.dumps(query)
+            self._request("POST", "/app/DataAccess/Refresh", idempotent=True, headers=_json_headers, data=payload)
+            self.__read_values(device, payload)
+
+        unconfirmed = []
+        for module in data["Modules"]:
+            for written in module["Parameters"]:
+                parameter = device.get_parameter(module["ModuleIndex"], module["ModuleType"], written["ParameterID"])
+                if parameter.value is None or parameter.value.numeric_value is None or not math.isclose(
+                        parameter.value.numeric_value, written["NumericValue"],
+                        rel_tol=_write_tolerance, abs_tol=_write_tolerance):
+                    unconfirmed.append(parameter)
+        if unconfirmed:
+            LOGGER.warning("Device %s did not confirm %s written values yet", device.id, len(unconfirmed))
+        return unconfirmed
+
+    def __refresh_later(self, device: WemDevice, payload: str):
+        """Send the refresh in the background, the next read gets the refreshed values"""
+        with self.__refresh_lock:
+            if device.id in self.__pending_refreshes:
+                return
+            self.__pending_refreshes.add(device.id)
+            if self.__refresh_executor is None:
+                self.__refresh_executor = ThreadPoolExecutor(thread_name_prefix="wemportal-refresh")
+        self.__refresh_executor.submit(self.__refresh, device.id, payload)
+
+    def __refresh(self, device_id: int, payload: str):
+        try:
+            with self.instrumentation.device(device_id):
+                self._request("POST", "/app/DataAccess/Refresh", idempotent=True,
+                              headers=_json_headers, data=payload)
+        except Exception as error:  # pylint: disable=broad-except
+            # Nobody waits for the refresh, the next cycle refreshes again
+            LOGGER.warning("Background refresh of device %s failed: %s", device_id, error)
+        finally:
+            with self.__refresh_lock:
+                self.__pending_refreshes.discard(device_id)
 
-            # Read
-            values = self.session.post(
-                f"{wem_url}/app/DataAccess/Read",
-                headers=headers,
-                data=json.dumps(data),
-            ).json()
+    def __set_values(self, device: WemDevice, values: Dict):
+        updated = []
+        for module in values['Modules']:
+            module_object = device.get_module(module['ModuleIndex'], module['ModuleType'])
+            if module_object is None:
+                LOGGER.warning("Ignoring values of unknown module %s/%s of device %s",
+                               module['ModuleIndex'], module['ModuleType'], device.id)
+                continue
 
-            for module in values['Modules']:
-                module_object = next((mod for mod in device.modules
-                                      if mod.index == module['ModuleIndex'] and int(mod.type) == module['ModuleType']),
-                                     None)
+            for value in module['Values']:
+                value_object = self.__value_parser.load(value)
+                parameter = module_object.get_parameter(value_object.parameter_id)
+                if parameter is None:
+                    LOGGER.warning("Ignoring value of unknown parameter %s in module %s/%s of device %s",
+                                   value_object.parameter_id, module['ModuleIndex'], module['ModuleType'], device.id)
+                    continue
+                parameter.value = value_object
+                updated.append((module_object, parameter))
 
-                for value in module['Values']:
-                    value_object = WemValueParser.load(value)
-                    parameter = next((param for param in module_object.parameters
-                                      if param.parameter_id == value_object.parameter_id), None)
-                    parameter.value = value_object
+        if self.change_detector:
+            self.change_detector.update(device, updated)
 
     def logout(self):
-        """Delete session"""
+        """Delete session, pending background refreshes are dropped"""
+        with self.__refresh_lock:
+            executor, self.__refresh_executor = self.__refresh_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
         self.session.close()
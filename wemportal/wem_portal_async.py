@@ -0,0 +1,282 @@
+"""
+Interact with wemportal via asyncio
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from wemportal.cache import ParameterCache, StructureCache
+from wemportal.changes import ChangeDetector
+from wemportal.constants import LOGGER
+from wemportal.metrics import Instrumentation
+from wemportal.model.wem_device import WemDevice
+from wemportal.model.wem_parameter import WemParameter
+from wemportal.model.wem_statistic import GraphType, StatisticType
+from wemportal.resilience import AdaptiveLimit, ResiliencePolicy
+from wemportal.refresh import RefreshPolicy
+from wemportal.scheduler import PollScheduler
+from wemportal.session_store import SessionStore
+from wemportal.transport import Transport
+from wemportal.wem_portal_api import WemPortalAPI
+from wemportal.wem_portal_web import WemPortalWeb
+
+default_concurrency = 8
+
+
+class AsyncRunner:
+    """
+    Run blocking portal requests in worker threads with a concurrency cap
+    """
+
+    def __init__(self, max_concurrency: int = default_concurrency):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency: int = max_concurrency
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="wemportal"
+        )
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+
+    async def run(self, func, *args):
+        """Run func(*args) in a worker thread once a slot is free"""
+        if self.__semaphore is None:
+            # Created lazily to bind to the running event loop
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.__semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.__executor, func, *args)
+
+    def size_pool(self, transport: Transport) -> Transport:
+        """Allow as many keep-alive connections as concurrent requests"""
+        transport.resize(self.max_concurrency)
+        return transport
+
+    def close(self):
+        """Shut down worker threads"""
+        self.__executor.shutdown(wait=False)
+
+
+class AsyncWemPortalAPI:
+    """
+    Class to interact with wemportal via api using asyncio
+    """
+
+    def __init__(self, username: str, password: str,
+                 max_concurrency: int = default_concurrency,
+                 runner: Optional[AsyncRunner] = None,
+                 parameter_cache: Optional[ParameterCache] = None,
+                 session_store: Optional[SessionStore] = None,
+                 scheduler: Optional[PollScheduler] = None,
+                 base_url: Optional[str] = None,
+                 resilience: Optional[ResiliencePolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 compact_models: bool = False,
+                 refresh_policy: Optional[RefreshPolicy] = None,
+                 change_detector: Optional[ChangeDetector] = None,
+                 transport: Optional[Transport] = None):
+        # pylint: disable=too-many-arguments
+        self.runner: AsyncRunner = runner or AsyncRunner(max_concurrency)
+        self.api: WemPortalAPI = WemPortalAPI(
+            username=username, password=password, parameter_cache=parameter_cache,
+            session_store=session_store, scheduler=scheduler, base_url=base_url,
+            resilience=resilience or ResiliencePolicy(limit=AdaptiveLimit(self.runner.max_concurrency)),
+            instrumentation=instrumentation, compact_models=compact_models, refresh_policy=refresh_policy,
+            change_detector=change_detector, transport=self.runner.size_pool(transport or Transport())
+        )
+
+    @property
+    def devices(self) -> List[WemDevice]:
+        """Devices known to the api"""
+        return self.api.devices
+
+    async def login(self):
+        """Login to api"""
+        await self.runner.run(self.api.login)
+
+    async def fetch(self):
+        """Get data from the mobile API"""
+        if not self.api.logged_in:
+            await self.login()
+
+        if not self.api.devices:
+            await self.get_devices()
+
+        await self.get_values()
+
+        return self.api.devices
+
+    async def get_devices(self):
+        """Fetching api device data, parameters of all modules concurrently"""
+        devices = await self.runner.run(self.api.read_devices)
+        for device in devices:
+            self.api.parameter_cache.prune(device)
+        await asyncio.gather(*[
+            self.runner.run(self.api.get_module_parameters, device, module)
+            for device in devices
+            for module in device.modules
+        ])
+        await self.runner.run(self.api.parameter_cache.save)
+        self.api.devices = devices
+
+    async def get_values(self):
+        """Refresh and retrieve new values of all devices concurrently"""
+        LOGGER.debug("Refreshing and retrieving new values")
+        await asyncio.gather(*[
+            self.runner.run(self.api.get_device_values, device)
+            for device in self.api.devices
+        ])
+
+    async def write_values(self, device: WemDevice, values: Dict[Tuple[int, int, str], Union[float, str]],
+                           confirm: bool = True) -> List[WemParameter]:
+        """Write values keyed by module index, module type and parameter id, see WemPortalAPI.write_values"""
+        return await self.runner.run(self.api.write_values, device, values, confirm)
+
+    async def logout(self):
+        """Delete session"""
+        await self.runner.run(self.api.logout)
+
+
+class AsyncWemPortalWeb:
+    """
+    Class to interact with wemportal via webgui using asyncio
+    """
+
+    def __init__(self, username: str, password: str,
+                 max_concurrency: int = default_concurrency,
+                 runner: Optional[AsyncRunner] = None,
+                 structure_cache: Optional[StructureCache] = None,
+                 session_store: Optional[SessionStore] = None,
+                 base_url: Optional[str] = None,
+                 resilience: Optional[ResiliencePolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 transport: Optional[Transport] = None):
+        # pylint: disable=too-many-arguments
+        self.runner: AsyncRunner = runner or AsyncRunner(max_concurrency)
+        self.web: WemPortalWeb = WemPortalWeb(
+            username=username, password=password, structure_cache=structure_cache,
+            session_store=session_store, base_url=base_url,
+            resilience=resilience or ResiliencePolicy(limit=AdaptiveLimit(self.runner.max_concurrency)),
+            instrumentation=instrumentation, transport=self.runner.size_pool(transport or Transport())
+        )
+
+    async def login(self):
+        """Login to wemportal webgui"""
+        await self.runner.run(self.web.login)
+
+    async def get_statistic(self, device: WemDevice,
+                            statistics_type: StatisticType,
+                            graph_type: GraphType = GraphType.daily):
+        """Retrieve statistics of the given type"""
+        return await self.runner.run(self.web.get_statistic, device, statistics_type, graph_type)
+
+    async def sync_statistic(self, device: WemDevice,
+                             statistics_type: StatisticType,
+                             graph_type: GraphType = GraphType.daily):
+        """Retrieve only statistic values newer than the held ones"""
+        return await self.runner.run(self.web.sync_statistic, device, statistics_type, graph_type)
+
+    async def get_statistics(self, devices: Iterable[WemDevice],
+                             statistics_types: Iterable[StatisticType] = tuple(StatisticType),
+                             incremental: bool = False,
+                             graph_type: GraphType = GraphType.daily):
+        """Retrieve all requested statistics of all devices concurrently"""
+        get_statistic = self.sync_statistic if incremental else self.get_statistic
+        devices = list(devices)
+        statistics_types = list(statistics_types)
+        if not statistics_types:
+            return
+        # Warm the structure cache once per device instead of once per statistic
+        await asyncio.gather(*[
+            self.runner.run(self.web.get_system_table_ids, device)
+            for device in devices
+        ])
+        await asyncio.gather(*[
+            get_statistic(device, statistics_type, graph_type)
+            for device in devices
+            for statistics_type in statistics_types
+        ])
+
+    async def logout(self):
+        """Logout from wemportal webgui"""
+        await self.runner.run(self.web.logout)
+
+
+class AsyncWemPortal:
+    """
+    Class to interact with wemportal via api and web using asyncio
+    """
+
+    def __init__(self, username: str, password: str, max_concurrency: int = default_concurrency,
+                 structure_cache: Optional[StructureCache] = None,
+                 parameter_cache: Optional[ParameterCache] = None,
+                 session_store: Optional[SessionStore] = None,
+                 scheduler: Optional[PollScheduler] = None,
+                 base_url: Optional[str] = None,
+                 resilience: Optional[ResiliencePolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 compact_models: bool = False,
+                 refresh_policy: Optional[RefreshPolicy] = None,
+                 change_detector: Optional[ChangeDetector] = None,
+                 transport: Optional[Transport] = None):
+        # pylint: disable=too-many-arguments
+        self.username: str = username
+        self.password: str = password
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
+        self.__runner: AsyncRunner = AsyncRunner(max_concurrency)
+        # Api and web requests share breakers and the adaptive concurrency limit
+        resilience = resilience or ResiliencePolicy(limit=AdaptiveLimit(max_concurrency))
+        # and keep-alive connections, sized to the concurrency
+        transport = self.__runner.size_pool(transport or Transport())
+        self.__api: AsyncWemPortalAPI = AsyncWemPortalAPI(
+            username=username, password=password, runner=self.__runner,
+            parameter_cache=parameter_cache, session_store=session_store, scheduler=scheduler,
+            base_url=base_url, resilience=resilience, instrumentation=self.instrumentation,
+            compact_models=compact_models, refresh_policy=refresh_policy,
+            change_detector=change_detector, transport=transport
+        )
+        self.__web: AsyncWemPortalWeb = AsyncWemPortalWeb(
+            username=username, password=password, runner=self.__runner,
+            structure_cache=structure_cache, session_store=session_store, base_url=base_url,
+            resilience=resilience, instrumentation=self.instrumentation, transport=transport
+        )
+
+    async def login(self):
+        """Login to api, the web login follows with the first statistics request"""
+        await self.__api.login()
+
+    async def fetch_devices(self,
+                            incremental_statistics: bool = False,
+                            statistics_types: Optional[Iterable[StatisticType]] = None,
+                            graph_type: GraphType = GraphType.daily):
+        """
+        Fetch data, values and the given statistic types (all by default) of all devices run concurrently
+        """
+        with self.instrumentation.run("fetch_devices") as run:
+            if not self.__api.api.logged_in:
+                await self.__api.login()
+
+            if not self.__api.devices:
+                await self.__api.get_devices()
+
+            devices = self.__api.devices
+            run.extend(devices)
+            await asyncio.gather(
+                self.__api.get_values(),
+                self.__web.get_statistics(
+                    devices,
+                    statistics_types=tuple(StatisticType) if statistics_types is None else statistics_types,
+                    incremental=incremental_statistics,
+                    graph_type=graph_type,
+                ),
+            )
+
+        return devices
+
+    async def write_values(self, device: WemDevice, values: Dict[Tuple[int, int, str], Union[float, str]],
+                           confirm: bool = True) -> List[WemParameter]:
+        """Write values keyed by module index, module type and parameter id, see WemPortalAPI.write_values"""
+        return await self.__api.write_values(device, values, confirm)
+
+    async def logout(self):
+        """Logout from api and web"""
+        await asyncio.gather(self.__api.logout(), self.__web.logout())
+        self.__runner.close()
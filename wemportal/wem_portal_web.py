@@ -1,37 +1,79 @@
 """
 Interact with wemportal via webgui
 """
-from datetime import datetime
-import requests
-from bs4 import BeautifulSoup
-from requests import Session
+import threading
+import time
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set, Tuple
+from requests import Response, Session
+from wemportal.cache import StructureCache
 from wemportal.constants import wem_url, LOGGER
 from wemportal.exceptions import WemPortalConnectionError
+from wemportal.metrics import Instrumentation
 from wemportal.model.wem_device import WemDevice
-from wemportal.model.wem_statistic import GraphType, StatisticType, \
+from wemportal.model.wem_series import to_timestamp
+from wemportal.model.wem_statistic import GraphType, StatisticType, WemStatistic, \
     WemHeatingStatisticParser, WemHotWaterStatisticParser, WemSummaryStatisticParser, \
     WemDefrostStatisticParser, WemCoolingStatisticParser
+from wemportal.resilience import ResiliencePolicy
+from wemportal.session_store import SessionStore
+from wemportal.transport import Transport
+
+# Device attribute and parser for every statistic type
+statistic_parsers = {
+    StatisticType.heating: ("heating_statistic", WemHeatingStatisticParser),
+    StatisticType.hot_water: ("hot_water_statistic", WemHotWaterStatisticParser),
+    StatisticType.summary: ("summary_statistic", WemSummaryStatisticParser),
+    StatisticType.defrost: ("defrost_statistic", WemDefrostStatisticParser),
+    StatisticType.cooling: ("cooling_statistic", WemCoolingStatisticParser),
+}
+
 
 class WemPortalWeb:
+    # pylint: disable=too-many-instance-attributes
     """
     Class to interact with wemportal via webgui
     """
 
-    def __init__(self, username: str, password: str):
-        self.session: Session = requests.Session()
+    def __init__(self, username: str, password: str,
+                 structure_cache: Optional[StructureCache] = None,
+                 session_store: Optional[SessionStore] = None,
+                 base_url: Optional[str] = None,
+                 session: Optional[Session] = None,
+                 resilience: Optional[ResiliencePolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 transport: Optional[Transport] = None):
+        # pylint: disable=too-many-arguments
+        self.base_url: str = base_url or wem_url
+        self.transport: Transport = transport or Transport()
+        self.session: Session = session or self.transport.session()
         self.session.headers.update({'User-Agent': 'Mozilla/5.0"'})
         self.session.cookies.clear()
         self.username: str = username
         self.password: str = password
+        self.structure_cache: StructureCache = structure_cache or StructureCache()
+        self.session_store: Optional[SessionStore] = session_store
+        self.resilience: ResiliencePolicy = resilience or ResiliencePolicy()
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
+        self.__session_key: str = f"web:{username}"
+        self.__login_lock = threading.Lock()
+        self.__login_count: int = 0
 
-    def login(self):
+    def login(self, force: bool = False):
         """
-        Login to wemportal webgui
+        Login to wemportal webgui, a stored session is reused unless force is set
         """
+        if not force and self.session_store and self.session_store.restore(self.__session_key, self.session):
+            LOGGER.debug("Reusing stored web session")
+            self.__login_count += 1
+            return
 
         LOGGER.debug("Login to wemportal")
+        self.session.cookies.clear()
         # Request login page to scrape hidden inputs
-        response = self.session.get(f'{wem_url}/Web/Login.aspx')
+        response = self.resilience.send(self.session, "GET", self.base_url, "/Web/Login.aspx",
+                                        instrumentation=self.instrumentation)
         data = _get_hidden_input(response.content)
 
         # Fill form
@@ -40,83 +82,142 @@ class WemPortalWeb:
         data['ctl00$content$btnLogin'] = 'Anmelden'
 
         # login
-        web_response = self.session.post(f'{wem_url}/Web/Login.aspx', data=data)
+        web_response = self.resilience.send(self.session, "POST", self.base_url, "/Web/Login.aspx",
+                                            instrumentation=self.instrumentation, data=data)
         if web_response.status_code != 200:
             raise WemPortalConnectionError(
                 f"Authentication Error: "
                 f"Check if your login credentials are correct. "
                 f"Receive response code: {web_response.status_code}, response: {web_response.content}"
             )
+        if self.session_store:
+            self.session_store.save(self.__session_key, self.session)
+        self.__login_count += 1
 
-    def __get_raw_statistic(self, device: WemDevice,
-                            statistics_type: StatisticType,
-                            graph_type: GraphType = GraphType.daily):
+    def _request(self, method: str, path: str, idempotent: Optional[bool] = None, **kwargs) -> Response:
         """
-        Retrieve data from wemportal webgui
+        Send request to webgui, login on first use and again once if the portal rejects the session.
+        GET and requests marked idempotent are retried by the resilience policy.
         """
+        if not self.__login_count:
+            with self.__login_lock:
+                if not self.__login_count:
+                    self.login()
+        login_count = self.__login_count
+        response = self.resilience.send(self.session, method, self.base_url, path, idempotent,
+                                        self.instrumentation, **kwargs)
+        if _is_rejected(response):
+            with self.__login_lock:
+                # Concurrent requests share a single new login
+                if login_count == self.__login_count:
+                    LOGGER.debug("Web session rejected, login again")
+                    self.login(force=True)
+            response = self.resilience.send(self.session, method, self.base_url, path, idempotent,
+                                            self.instrumentation, **kwargs)
+        return response
+
+    def get_system_table_ids(self, device: WemDevice) -> List[int]:
+        """
+        Return the SystemTableIDs of a device, the structure is only requested on a cache miss
+        """
+        system_table_ids = self.structure_cache.get(device.id)
+        if system_table_ids is not None:
+            return system_table_ids
 
         # Get device structure
-        response = self.session.get(f"{wem_url}/Web/Api/DeviceStatistics/GetStructure?deviceId={device.id}")
+        response = self._request("GET", f"/Web/Api/DeviceStatistics/GetStructure?deviceId={device.id}")
         device_structure = response.json()
         modules = []
         for group in device_structure:
             for module in group["Modules"]:
                 modules.append(module)
         system_table_ids = [module["SystemTableID"] for module in modules]
-        data = {
-            'SystemTableIDs[]': system_table_ids,
-            'StatisticsType': int(statistics_type),
-            'GraphType': int(graph_type),
-            'MaxDisplayTime': datetime.now(),
-            'MonthType': '0',
-        }
-
-        response = self.session.post(
-            f'{wem_url}/Web/Api/DeviceStatistics/GetStatistics',
-            data=data,
-        )
-        return response.json()
-
-    def get_heating_statistic(self, device: WemDevice):
-        """Retrieve statistics for heating system"""
-        graph_type = GraphType.daily
-        data = self.__get_raw_statistic(device=device, statistics_type=StatisticType.heating, graph_type = graph_type)
-        heating_statistic = WemHeatingStatisticParser.load(statistic=data, graph_type=graph_type)
-        device.heating_statistic = heating_statistic
-        return device
+        self.structure_cache.set(device.id, system_table_ids)
+        return system_table_ids
 
-    def get_hot_water_statistic(self, device: WemDevice):
-        """Retrieve statistics for hot water system"""
-        graph_type = GraphType.daily
-        data = self.__get_raw_statistic(device=device, statistics_type=StatisticType.hot_water, graph_type = graph_type)
-        hot_water_statistic = WemHotWaterStatisticParser.load(statistic=data, graph_type=graph_type)
-        device.hot_water_statistic = hot_water_statistic
-        return device
+    def __get_raw_statistic(self, device: WemDevice,
+                            statistics_type: StatisticType,
+                            graph_type: GraphType = GraphType.daily,
+                            max_display_time: Optional[datetime] = None):
+        """
+        Retrieve data from wemportal webgui, the portal returns one window ending at max_display_time
+        """
+        with self.instrumentation.device(device.id):
+            system_table_ids = self.get_system_table_ids(device)
+            data = {
+                'SystemTableIDs[]': system_table_ids,
+                'StatisticsType': int(statistics_type),
+                'GraphType': int(graph_type),
+                'MaxDisplayTime': max_display_time or datetime.now(),
+                'MonthType': '0',
+            }
 
-    def get_summary_statistic(self, device: WemDevice):
-        """Retrieve statistics for hot water system"""
-        graph_type = GraphType.daily
-        data = self.__get_raw_statistic(device=device, statistics_type=StatisticType.summary, graph_type = graph_type)
-        summary_statistic = WemSummaryStatisticParser.load(statistic=data, graph_type=graph_type)
-        device.summary_statistic = summary_statistic
+            response = self._request("POST", "/Web/Api/DeviceStatistics/GetStatistics", idempotent=True, data=data)
+            return response.json()
+
+    def __load_statistic(self, device: WemDevice, statistics_type: StatisticType,
+                         data: Dict, graph_type: GraphType) -> WemStatistic:
+        statistic_parser = statistic_parsers[statistics_type][1]
+        with self.instrumentation.device(device.id), \
+                self.instrumentation.parse(statistic_parser.__name__, len(data.get("Data") or ())):
+            return statistic_parser.load(statistic=data, graph_type=graph_type)
+
+    def get_statistic(self, device: WemDevice,
+                      statistics_type: StatisticType,
+                      graph_type: GraphType = GraphType.daily):
+        """Retrieve statistics of the given type and store them at the device"""
+        attribute = statistic_parsers[statistics_type][0]
+        data = self.__get_raw_statistic(device=device, statistics_type=statistics_type, graph_type=graph_type)
+        setattr(device, attribute, self.__load_statistic(device, statistics_type, data, graph_type))
         return device
 
-    def get_defrost_statistic(self, device: WemDevice):
-        """Retrieve statistics for hot water system"""
-        graph_type = GraphType.daily
-        data = self.__get_raw_statistic(device=device, statistics_type=StatisticType.defrost, graph_type = graph_type)
-        defrost_statistic = WemDefrostStatisticParser.load(statistic=data, graph_type=graph_type)
-        device.defrost_statistic = defrost_statistic
+    def sync_statistic(self, device: WemDevice,
+                       statistics_type: StatisticType,
+                       graph_type: GraphType = GraphType.daily,
+                       max_windows: int = 12):
+        """
+        Retrieve only statistic values newer than the ones held by the device and merge them.
+        Windows are requested backwards until they reach the held values or max_windows is hit.
+        """
+        attribute = statistic_parsers[statistics_type][0]
+        held = getattr(device, attribute)
+        if held is None or held.graph_type != graph_type or not held.values:
+            return self.get_statistic(device, statistics_type, graph_type)
+
+        # The latest held value may belong to an unfinished period, so it is requested again.
+        # Compared as timestamps, the portal may return naive and aware dates
+        cutoff = held.series.timestamps[-1]
+        max_display_time = None
+        for _ in range(max_windows):
+            data = self.__get_raw_statistic(device=device, statistics_type=statistics_type,
+                                            graph_type=graph_type, max_display_time=max_display_time)
+            window = self.__load_statistic(device, statistics_type, data, graph_type)
+            held.merge(window)
+            if not window.has_data or not window.series or to_timestamp(window.min_date) <= cutoff:
+                break
+            max_display_time = window.min_date - timedelta(days=1)
+
         return device
 
+    def get_heating_statistic(self, device: WemDevice, graph_type: GraphType = GraphType.daily):
+        """Retrieve statistics for heating system"""
+        return self.get_statistic(device, StatisticType.heating, graph_type)
 
-    def get_cooling_statistic(self, device: WemDevice):
+    def get_hot_water_statistic(self, device: WemDevice, graph_type: GraphType = GraphType.daily):
         """Retrieve statistics for hot water system"""
-        graph_type = GraphType.daily
-        data = self.__get_raw_statistic(device=device, statistics_type=StatisticType.cooling, graph_type = graph_type)
-        cooling_statistic = WemCoolingStatisticParser.load(statistic=data, graph_type=graph_type)
-        device.cooling_statistic = cooling_statistic
-        return device
+        return self.get_statistic(device, StatisticType.hot_water, graph_type)
+
+    def get_summary_statistic(self, device: WemDevice, graph_type: GraphType = GraphType.daily):
+        """Retrieve summary statistics for the system"""
+        return self.get_statistic(device, StatisticType.summary, graph_type)
+
+    def get_defrost_statistic(self, device: WemDevice, graph_type: GraphType = GraphType.daily):
+        """Retrieve statistics for defrost system"""
+        return self.get_statistic(device, StatisticType.defrost, graph_type)
+
+    def get_cooling_statistic(self, device: WemDevice, graph_type: GraphType = GraphType.daily):
+        """Retrieve statistics for cooling system"""
+        return self.get_statistic(device, StatisticType.cooling, graph_type)
 
     def logout(self):
         """
@@ -125,10 +226,107 @@ class WemPortalWeb:
         self.session.close()
 
 
-def _get_hidden_input(content):
+class LazyStatisticLoader:
     """
-    Return a dict containing hidden input from content
+    Statistic loader for WemDevice.statistic_loader, fetches a statistic on first access and after ttl seconds
     """
+
+    def __init__(self, web: WemPortalWeb, ttl: float = 60 * 60, graph_type: GraphType = GraphType.daily):
+        self.web: WemPortalWeb = web
+        self.ttl: float = ttl
+        self.graph_type: GraphType = graph_type
+        self.__loaded: Dict[Tuple[int, StatisticType], float] = {}
+        self.__loading: Set[Tuple[int, StatisticType]] = set()
+        self.__lock = threading.Lock()
+
+    def refresh(self, device: WemDevice, statistics_type: StatisticType):
+        """Fetch the statistic if it was never loaded, is older than ttl or the device does not hold it"""
+        key = (device.id, statistics_type)
+        # Read the stored value, the attribute would ask this loader again
+        held = getattr(device, f"_{statistic_parsers[statistics_type][0]}", None) is not None
+        with self.__lock:
+            loaded = self.__loaded.get(key)
+            # Concurrent and nested accesses do not fetch again while a fetch is running
+            if key in self.__loading or (held and loaded is not None and time.monotonic() - loaded < self.ttl):
+                return
+            self.__loading.add(key)
+        try:
+            self.web.get_statistic(device, statistics_type, self.graph_type)
+            with self.__lock:
+                self.__loaded[key] = time.monotonic()
+        finally:
+            with self.__lock:
+                self.__loading.discard(key)
+
+    def invalidate(self, device: Optional[WemDevice] = None):
+        """Fetch statistics of a device or of all devices again on next access"""
+        with self.__lock:
+            for key in [key for key in self.__loaded if device is None or key[0] == device.id]:
+                del self.__loaded[key]
+
+
+def _is_rejected(response: Response) -> bool:
+    """
+    Check if the webgui rejected the session, expired sessions are redirected to the login page
+    """
+    return response.status_code in (401, 403) or "Login.aspx" in response.url
+
+
+class _HiddenInputParser(HTMLParser):
+    """
+    Collect name and value of hidden inputs, done once the form containing them is closed
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tags: Dict[str, Optional[str]] = {}
+        self.done: bool = False
+
+    def error(self, message):
+        """Raise parse errors, abstract in python < 3.10"""
+        raise ValueError(message)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "input":
+            attributes = dict(attrs)
+            if (attributes.get("type") or "").lower() == "hidden" and "name" in attributes:
+                self.tags[attributes["name"]] = attributes.get("value")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "form" and self.tags:
+            self.done = True
+
+
+def _get_hidden_input(content, chunk_size: int = 16 * 1024):
+    """
+    Return a dict containing hidden input from content.
+    The page is parsed in chunks until the login form is closed, BeautifulSoup is only used
+    if this finds no hidden inputs.
+    """
+    text = content.decode("utf-8", errors="replace") if isinstance(content, bytes) else content
+    parser = _HiddenInputParser()
+    try:
+        for start in range(0, len(text), chunk_size):
+            parser.feed(text[start:start + chunk_size])
+            if parser.done:
+                break
+        else:
+            parser.close()
+    except ValueError as error:
+        LOGGER.debug("Parsing login page failed: %s", error)
+    if parser.tags:
+        return parser.tags
+
+    LOGGER.debug("No hidden inputs found, parsing login page with BeautifulSoup")
+    try:
+        from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise WemPortalConnectionError(
+            "Could not read the login form of the webgui, install wemportal[html] to parse it with BeautifulSoup"
+        ) from error
     tags = {}
     soup = BeautifulSoup(content, 'html.parser')
     hidden_tags = soup.find_all('input', type='hidden')